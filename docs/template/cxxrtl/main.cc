@@ -1,46 +1,47 @@
 #include <cassert>
-#include <fstream>
 #include <iostream>
-#include <optional>
 
-#include <cxxrtl/cxxrtl_vcd.h>
+#include <niar/harness.h>
 #include <newproject.h>
 
 static cxxrtl_design::p_newproject top;
-static cxxrtl::vcd_writer vcd;
+static niar::waveform_writer waves;
+static niar::bench bench;
 static uint64_t vcd_time = 0;
 
 static void step() {
   top.p_clk.set(true);
   top.step();
-  vcd.sample(vcd_time++);
+  waves.sample(vcd_time++);
   top.p_clk.set(false);
   top.step();
-  vcd.sample(vcd_time++);
+  waves.sample(vcd_time++);
 }
 
 int main(int argc, char **argv) {
-  std::optional<std::string> vcd_out = std::nullopt;
+  niar::waveform_options waveform;
 
   for (int i = 1; i < argc; ++i) {
-    if (strcmp(argv[i], "--vcd") == 0 && argc >= (i + 2)) {
-      vcd_out = std::string(argv[++i]);
-    } else {
+    if (!waveform.parse(argc, argv, i) && !bench.parse(argc, argv, i)) {
       std::cerr << "unknown argument \"" << argv[i] << "\"" << std::endl;
       return 2;
     }
   }
 
-  if (vcd_out.has_value()) {
+  if (waveform.path.has_value()) {
     debug_items di;
     top.debug_info(&di, nullptr, "top ");
-    vcd.add(di);
+    if (!waves.open(waveform, di)) {
+      std::cerr << "couldn't open \"" << *waveform.path << "\"" << std::endl;
+      return 2;
+    }
   }
 
   top.p_rst.set(true);
   step();
 
   top.p_rst.set(false);
+  bench.start();
 
   // ledr should be low or high according to 'expected', where each element
   // represents 1/4th of a second. ledg should always be high.
@@ -52,6 +53,10 @@ int main(int argc, char **argv) {
   std::vector<int> expected = {0, 1, 1, 0, 0, 1, 1, 0};
   for (std::vector<int>::size_type i = 0; i < expected.size() && !done; ++i) {
     for (int j = 0; j < (CLOCK_HZ / 4); ++j) {
+      if ((vcd_time >> 1) >= bench.cycles) {
+        done = true;
+        break;
+      }
       if (top.p_ledr.get<int>() != expected[i]) {
         std::cerr << "unexpected ledr at i(" << i << "), j(" << j << ")"
                   << std::endl;
@@ -65,12 +70,9 @@ int main(int argc, char **argv) {
     }
   }
 
-  std::cout << "finished on cycle " << (vcd_time >> 1) << std::endl;
+  bench.finish(vcd_time >> 1);
 
-  if (vcd_out.has_value()) {
-    std::ofstream of(*vcd_out);
-    of << vcd.buffer;
-  }
+  waves.close();
 
   return rc;
 }
@@ -1,18 +1,30 @@
 from argparse import ArgumentParser
 
-from . import build, cxxrtl
 from .cxxrtl_platform import CxxrtlPlatform
 from .project import Project
 
-__all__ = ["Project", "cli", "CxxrtlPlatform"]
+__all__ = ["Project", "cli", "CxxrtlPlatform", "cache_rtlil"]
+
+
+def __getattr__(name):
+    if name == "cache_rtlil":
+        from .rtlil_cache import cache_rtlil
+        return cache_rtlil
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def cli(np: Project):
+    # Subcommands are imported here rather than at the top, so that importing
+    # niar (e.g. to define a Project) stays cheap.
+    from . import build, cxxrtl, history, trace
+
     parser = ArgumentParser(prog=np.name)
     subparsers = parser.add_subparsers(required=True)
 
     build.add_arguments(
         np, subparsers.add_parser("build", help="build the design, and optionally program it"))
+    history.add_arguments(
+        np, subparsers.add_parser("history", help="show metrics of past builds, or compare against a revision"))
     if np.cxxrtl_targets:
         cxxrtl.add_arguments(
             np, subparsers.add_parser("cxxrtl", help="run the C++ simulator tests"))
@@ -21,4 +33,5 @@ def cli(np: Project):
         command.add_arguments(np, subparsers.add_parser(command.name, help=command.help))
 
     args = parser.parse_args()
-    args.func(args)
+    with trace.tracing(getattr(args, "trace", None)):
+        args.func(args)
@@ -1,15 +1,33 @@
+import hashlib
 import inspect
+import json
 import logging
-import re
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from functools import partial
-from typing import Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-from amaranth.build import Platform
-from amaranth.build.run import LocalBuildProducts
-
-from .cmdrunner import CommandRunner
+from . import trace
+from .cache import ArtifactCache
+from .cmdrunner import CommandFailedError, CommandRunner, write_if_changed
+from .complexity import DesignComplexity
+from .elaboration import ElaborationCache, elaboration_digest
+from .emit import can_stream, streaming_prepare
 from .logging import logger, logtime
+from .profiling import ElaborationProfile
 from .project import Project
+from .report import BuildReport, Utilisation
+from .rtlil_cache import RtlilCache
+
+if TYPE_CHECKING:
+    # Importing amaranth.build brings in the RTLIL backend and the Yosys
+    # toolchain; don't pay for that until a build actually happens.
+    from amaranth.build import Platform
+    from amaranth.build.run import BuildPlan
 
 __all__ = ["add_arguments"]
 
@@ -23,10 +41,11 @@ def add_arguments(np: Project, parser):
             parser.add_argument(
                 "-b",
                 "--board",
-                choices=[first, *rest],
-                help="which board to build for",
+                action="append",
+                choices=[first, *rest, "all"],
+                help="which board to build for; may be given more than once, or 'all' for every target",
                 required=bool(rest),
-                **({"default": first} if not rest else {}),
+                **({"default": [first]} if not rest else {}),
             )
     parser.add_argument(
         "-p",
@@ -44,117 +63,482 @@ def add_arguments(np: Project, parser):
         "-f",
         "--force",
         action="store_true",
-        help="don't use cached synthesis",
+        help="don't use cached synthesis (including from NIAR_CACHE_DIR)",
+    )
+    parser.add_argument(
+        "-s",
+        "--seeds",
+        type=parse_seeds,
+        help="place and route with each of N seeds (or a comma-separated list), keeping the best timing",
+    )
+    parser.add_argument(
+        "--synth-only",
+        action="store_true",
+        help="only synthesise, reporting cell counts and estimated utilisation without place-and-route",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="maximum number of processes to run at once (default: number of cores)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="write a Chrome/Perfetto trace of where the time went",
+    )
+    parser.add_argument(
+        "--profile-elab",
+        action="store_true",
+        help="profile elaboration, reporting time and memory per module (implies re-elaborating)",
     )
 
 
 def main(np: Project, args):
-    logger.info("building %s for %s", np.name, args.board)
+    if args.synth_only and (args.program or args.seeds):
+        raise RuntimeError("--synth-only can't be combined with --program or --seeds")
+
+    if "all" in args.board:
+        boards = sorted(t.__name__ for t in np.targets)
+    else:
+        boards = list(dict.fromkeys(args.board))
+
+    if len(boards) == 1:
+        subdir = build_board(np, args, boards[0])
+        log_build_report(np, subdir, synth_only=args.synth_only)
+        return
+
+    if args.program:
+        raise RuntimeError("can only program one board at a time")
+
+    # Each board gets a process (elaboration holds the GIL) and a share of
+    # the jobs for its own synthesis/PnR.
+    subdirs = {}
+    failed = []
+    with logtime(logging.DEBUG, f"building for {len(boards)} boards"):
+        with ProcessPoolExecutor(max_workers=min(len(boards), args.jobs)) as pool:
+            futures = {
+                board: pool.submit(_build_board_in_worker, np, args, board, jobs=max(1, args.jobs // len(boards)))
+                for board in boards
+            }
+            for board, future in futures.items():
+                try:
+                    subdirs[board], events = future.result()
+                    if trace.tracer is not None:
+                        trace.tracer.events.extend(events)
+                except Exception as e:
+                    logger.error("building for %s failed: %s", board, e)
+                    failed.append(board)
+
+    for board, subdir in subdirs.items():
+        logger.info("")
+        logger.info("=== %s ===", board)
+        log_build_report(np, subdir, stats=args.synth_only, synth_only=args.synth_only)
+
+    if failed:
+        raise CommandFailedError(f"failed building for {', '.join(failed)}")
+
 
-    platform = np.target_by_name(args.board)
-    design = construct_top(np, platform)
+def _build_board_in_worker(np: Project, args, board: str, *, jobs: int):
+    # We're forked from a process which may be tracing; start afresh and
+    # hand our events back to be merged.
+    tracer = trace.start(f"niar ({board})") if trace.tracer is not None else None
+    subdir = build_board(np, args, board, jobs=jobs)
+    return subdir, tracer.events if tracer is not None else []
 
+
+def build_board(np: Project, args, board: str, *, jobs: Optional[int] = None) -> str:
+    from amaranth.build.run import BuildPlan, LocalBuildProducts
+    from amaranth.hdl import Fragment
+
+    from .history import History
+
+    logger.info("building %s for %s", np.name, board)
+
+    platform = np.target_by_name(board)
     subdir = type(platform).__name__
 
-    with logtime(logging.DEBUG, "elaboration"):
+    with logtime(logging.DEBUG, "elaboration") as elaboration:
         prepare_kwargs = {
             "debug_verilog": args.verilog,
             "yosys_opts": "-g",
         }
         prepare_kwargs.update(getattr(platform, "prepare_kwargs", {}))
-        for p in np.externals:
-            with open(np.path(p), 'rb') as f:
-                platform.add_file(p, f)
-        plan = platform.prepare(design, np.name, **prepare_kwargs)
-
-    il_fn = f"{np.name}.il"
-    il_size = len(plan.files[il_fn])
-    logger.debug(f"{il_fn!r}: {il_size:,} bytes")
-
-    with logtime(logging.DEBUG, "synthesis/pnr"):
-        cr = CommandRunner(force=args.force)
-        products = None
-        def execute_build():
-            nonlocal products
-            products = plan.execute_local(f"build/{subdir}")
 
-        # This is specific to toolchains that use Yosys, but I'm unlikely to use anything else ...
-        deps = [f"{np.name}.il", f"{np.name}.ys"] + np.externals
-        cr.add_process(execute_build,
-            infs=[{np.path.build(subdir, fn): plan.files[fn] for fn in deps}],
-            outf=np.path.build(subdir, np.name))
-        #   ^-- The outf doesn't exist here; it's only needed/used as basis for the digest name.
+        il_fn = f"{np.name}.il"
+        il_path = np.path.build(subdir, il_fn)
+        il_path.parent.mkdir(parents=True, exist_ok=True)
+
+        elab_cache = ElaborationCache(np.path.build(subdir),
+            elaboration_digest(np, platform, **prepare_kwargs))
+        profile = ElaborationProfile() if args.profile_elab else None
+        files = None if args.force or profile else elab_cache.load()
+        if files is not None:
+            logger.debug("design unchanged since last elaboration; reusing it")
+            plan = BuildPlan(script=f"build_{np.name}")
+            for fn in files:
+                # The RTLIL stays on disk; see below.
+                if fn != il_fn:
+                    plan.add_file(fn, np.path.build(subdir, fn).read_bytes())
+        else:
+            with (profile(np.name) if profile else nullcontext(),
+                  elab_cache.recording(exclude=np.path.build())):
+                design = construct_top(np, platform)
+                for p in np.externals:
+                    with open(np.path(p), 'rb') as f:
+                        platform.add_file(p, f)
+                # Elaborate first, so the separately converted modules of any
+                # @cache_rtlil components can be added before the plan is made.
+                with RtlilCache(np.path.build("rtlil-cache"), force=args.force) as rtlil_cache:
+                    fragment = Fragment.get(design, platform)
+                for name, rtlil_text in rtlil_cache.modules.items():
+                    platform.add_file(f"{name}.il", rtlil_text)
+                # The RTLIL can be hundreds of megabytes; where the platform only
+                # renders it into the .il file, write it there as it's generated
+                # rather than holding it (and copies of it) in the plan.
+                stream = can_stream(platform, debug_verilog=args.verilog)
+                with trace.span("prepare"), (streaming_prepare(platform, il_path) if stream else nullcontext()):
+                    plan = platform.prepare(fragment, np.name, **prepare_kwargs)
+                if not stream:
+                    write_if_changed(il_path, plan.files[il_fn])
+                del plan.files[il_fn]
+
+    if profile:
+        profile.log()
+        profile.save(np.path.build(subdir, "elaboration"))
+
+    logger.debug(f"{il_fn!r}: {il_path.stat().st_size:,} bytes")
+
+    cr = CommandRunner(force=args.force, jobs=jobs or args.jobs, cache=ArtifactCache.from_env())
+    add_synthesis_and_pnr(np, cr, plan, subdir, seeds=args.seeds, synth_only=args.synth_only,
+                          toolchain_env_var=platform._toolchain_env_var)
+    elab_cache.save([il_fn, *plan.files])
 
+    complexity = DesignComplexity.from_rtlil(il_path,
+        *(np.path.build(subdir, fn) for fn in plan.files if fn.endswith(".il")))
+    complexity.log()
+    complexity.save(np.path.build(subdir, f"{np.name}.complexity.json"))
+
+    with logtime(logging.DEBUG, "synthesis/pnr") as synthesis_pnr:
         cr.run()
-        if products is None:
-            # XXX: good lord.
-            products = LocalBuildProducts(np.path.build(subdir))
+        products = LocalBuildProducts(np.path.build(subdir))
+
+    if args.synth_only:
+        # Not recorded in the history: without PnR there's nothing to compare
+        # a full build's against.
+        BuildReport.from_logs(yosys=np.path.build(subdir, f"{np.name}.rpt")).save(
+            np.path.build(subdir, f"{np.name}.synth.report.json"))
+        return subdir
+
+    report = BuildReport.from_logs(
+        yosys=np.path.build(subdir, f"{np.name}.rpt"),
+        nextpnr=np.path.build(subdir, f"{np.name}.tim"),
+    )
+    report.save(np.path.build(subdir, f"{np.name}.report.json"))
+
+    with open(il_path, "rb") as f:
+        design_digest = hashlib.file_digest(f, "sha256").hexdigest()
+    History(np.path.build("history.sqlite")).record(np,
+        board=board,
+        design_digest=design_digest,
+        report=report,
+        durations={
+            "elaboration": elaboration.elapsed.total_seconds(),
+            "synthesis/pnr": synthesis_pnr.elapsed.total_seconds(),
+        })
 
     if args.program:
         with logtime(logging.DEBUG, "programming"):
             platform.toolchain_program(products, np.name)
 
-    yosys_report = np.path.build(subdir, f"{np.name}.rpt")
-    heading = re.compile(r"^\d+\.\d+\. Printing statistics\.$", flags=re.MULTILINE)
-    next_heading = re.compile(r"^\d+\.\d+\. ", flags=re.MULTILINE)
-    log_file_between(logging.INFO, yosys_report, heading, next_heading)
+    return subdir
+
+
+def log_build_report(np: Project, subdir: str, *, stats: bool = True, synth_only: bool = False):
+    if synth_only:
+        report = BuildReport.load(np.path.build(subdir, f"{np.name}.synth.report.json"))
+    else:
+        report = BuildReport.load(np.path.build(subdir, f"{np.name}.report.json"))
+
+    if stats:
+        for module, cells in report.cells.items():
+            logger.info(f"=== {module} ===")
+            for cell, count in sorted(cells.items()):
+                logger.info(f"  {cell:<24} {count:>8,}")
+            logger.info(f"  {'total':<24} {sum(cells.values()):>8,}")
+
+    if synth_only:
+        # The device's capacity is only known from a full build's report.
+        full_report_path = np.path.build(subdir, f"{np.name}.report.json")
+        available = {}
+        if full_report_path.exists():
+            available = {resource: u.available
+                         for resource, u in BuildReport.load(full_report_path).utilisation.items()}
+        logger.info("Estimated device utilisation (from synthesis):")
+        for resource, used in report.estimated_utilisation().items():
+            if resource in available:
+                utilisation = Utilisation(used=used, available=available[resource])
+                logger.info(f"  {resource:>24}: {used:>6}/{utilisation.available:>6} "
+                            f"{utilisation.fraction:>5.0%}")
+            else:
+                logger.info(f"  {resource:>24}: {used:>6}")
+        return
+
+    seeds_path = np.path.build(subdir, f"{np.name}.seeds.json")
+    if seeds_path.exists():
+        seeds = json.loads(seeds_path.read_text())
+        logger.info("Seeds:")
+        for result in seeds["results"]:
+            if result["status"] != 0:
+                summary = f"failed (status={result['status']}; see {result.get('log', 'its pnr.log')})"
+            else:
+                summary = ", ".join(f"{clock}: {mhz:.2f} MHz" for clock, mhz in result["fmax"].items())
+            best = " (best)" if result["seed"] == seeds["best"] else ""
+            logger.info(f"  {result['seed']:>4}: {summary}{best}")
 
-    nextpnr_report = np.path.build(subdir, f"{np.name}.tim")
     logger.info("Device utilisation:")
-    heading = re.compile(r"^Info: Device utilisation:$", flags=re.MULTILINE)
-    next_heading = re.compile(r"^Info: Placed ", flags=re.MULTILINE)
-    log_file_between(logging.INFO, nextpnr_report, heading, next_heading, prefix="Info: ")
-
-    # TODO:
-    # Info: Critical path report for cross-domain path 'posedge clk' -> '<async>':
-    # ...
-    # Info: 2.3 ns logic, 6.5 ns routing
-    timing_report = None
-    max_freq = re.compile(r"^Info: Max frequency for clock '", flags=re.MULTILINE)
-    slack_histo = re.compile(r"^Info: Slack histogram:", flags=re.MULTILINE)
-    with open(nextpnr_report, "r") as f:
-        for line in f:
-            if max_freq.match(line):
-                timing_report = [line]
-            elif timing_report is not None:
-                timing_report.append(line)
-
-    if timing_report is None:
+    for resource, utilisation in report.utilisation.items():
+        logger.info(f"  {resource:>24}: {utilisation.used:>6}/{utilisation.available:>6} "
+                    f"{utilisation.fraction:>5.0%}")
+
+    if not report.fmax:
         logger.warning("Couldn't extract timing information from nextpnr log")
-    else:
-        for line in timing_report:
-            if slack_histo.match(line):
-                break
-            line = line.rstrip()
-            line = line.removeprefix("Info: ")
-            logger.log(logging.INFO, line)
-
-def construct_top(np: Project, platform: Platform, **kwargs):
-    sig = inspect.signature(np.top)
-    if "platform" in sig.parameters:
-        kwargs["platform"] = platform
-    return np.top(**kwargs)
+    for clock, timing in report.fmax.items():
+        logger.info(f"Max frequency for clock {clock!r}: {timing.achieved_mhz:.2f} MHz "
+                    f"({'PASS' if timing.passed else 'FAIL'} at {timing.target_mhz:.2f} MHz)")
 
 
-def log_file_between(
-    level: int,
-    path: str,
-    start: re.Pattern,
-    end: re.Pattern,
+def add_synthesis_and_pnr(
+    np: Project,
+    cr: CommandRunner,
+    plan: "BuildPlan",
+    subdir: str,
     *,
-    prefix: Optional[str] = None,
+    seeds: Optional[list[int]] = None,
+    synth_only: bool = False,
+    toolchain_env_var: Optional[str] = None,
 ):
-    with open(path, "r") as f:
-        for line in f:
-            if start.match(line):
-                break
-        else:
-            return
-
-        for line in f:
-            if end.match(line):
-                return
-            line = line.rstrip()
-            if prefix is not None:
-                line = line.removeprefix(prefix)
-            logger.log(level, line)
+    """
+    Add the plan's synthesis and place-and-route to ``cr`` as separate units,
+    so that changing only constraints or PnR options reuses the netlist.
+    With ``synth_only``, only synthesis is added.
+    The design's RTLIL is expected to be in the build directory already,
+    rather than in the plan.
+
+    If ``toolchain_env_var`` (e.g. ``AMARANTH_ENV_IceStorm``) is set, the
+    plan is executed whole, so its build script can source the environment
+    script it names.
+    """
+    build_dir = np.path.build(subdir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    for fn, content in plan.files.items():
+        path = build_dir / fn
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_if_changed(path, content)
+
+    # Amaranth renders the build script's commands as JSON too; they start
+    # with Yosys and everything after is PnR and packing. Toolchains which
+    # don't fit that get the whole plan as one unit, as before.
+    commands = json.loads(plan.files.get(f"build_{np.name}.json", "{}")).get("commands", [])
+    synth_count = 0
+    while synth_count < len(commands) and commands[synth_count][0] == "yosys":
+        synth_count += 1
+    synth_cmds = [_resolve_tool(cmd) for cmd in commands[:synth_count]]
+    pnr_cmds = [_resolve_tool(cmd) for cmd in commands[synth_count:]]
+
+    # Yosys reads every RTLIL and Verilog file the plan has, including the
+    # modules of @cache_rtlil components.
+    synth_infs = list(dict.fromkeys([
+        f"{np.name}.il", f"{np.name}.ys", *np.externals,
+        *(fn for fn in plan.files
+          if fn.endswith((".il", ".v", ".sv")) and fn != f"{np.name}.debug.v"),
+    ]))
+    # Run on their own, the commands wouldn't get the environment the build
+    # script sources, e.g. the OSS CAD Suite's.
+    env_var = toolchain_env_var if toolchain_env_var in os.environ else None
+    if len(synth_cmds) != 1 or env_var:
+        for option, wanted in [("--synth-only", synth_only), ("--seeds", seeds)]:
+            if not wanted:
+                continue
+            if env_var:
+                raise RuntimeError(f"{option} can't be used with {env_var} set, as it runs the "
+                                   f"toolchain's commands without the build script that sources it")
+            raise RuntimeError(f"{option} needs a toolchain which synthesises with a single Yosys command")
+
+        # What the plan produces depends on the toolchain; a stamp stands in
+        # for it, so there's always an output to tell a complete build by.
+        stamp = build_dir / f"{np.name}.built"
+
+        def execute_build():
+            stamp.unlink(missing_ok=True)
+            plan.execute_local(build_dir)
+            stamp.touch()
+
+        cr.add_process(execute_build,
+            infs=[build_dir / fn for fn in synth_infs],
+            outf=stamp,
+            artifacts=[f"{np.name}.*"])
+        return
+
+    netlist = build_dir / f"{np.name}.json"
+    cr.add_process(synth_cmds[0],
+        infs=[build_dir / fn for fn in synth_infs],
+        outf=netlist,
+        chdir=build_dir,
+        artifacts=[f"{np.name}.json", f"{np.name}.rpt"])
+    if synth_only:
+        return
+
+    # Constraints are whatever else the plan has which isn't a build script.
+    constraints = [
+        build_dir / fn for fn in plan.files
+        if fn not in synth_infs and fn != f"{np.name}.debug.v"
+        and not fn.startswith(f"build_{np.name}.")
+    ]
+
+    seeds_path = build_dir / f"{np.name}.seeds.json"
+    if not seeds:
+        seeds_path.unlink(missing_ok=True)
+
+        # As for a whole plan, a stamp stands in for the toolchain's products.
+        stamp = build_dir / f"{np.name}.pnr"
+
+        def place_and_route():
+            stamp.unlink(missing_ok=True)
+            for cmd in pnr_cmds:
+                if status := subprocess.run(cmd, cwd=build_dir).returncode:
+                    return status
+            stamp.touch()
+
+        cr.add_process(place_and_route,
+            infs=[netlist, *constraints, {"pnr-commands": json.dumps(pnr_cmds)}],
+            outf=stamp,
+            artifacts=[f"{np.name}.*"])
+        return
+
+    # Each seed places and routes in its own directory, from copies of the
+    # netlist and constraints. A seed failing (e.g. on timing) isn't an
+    # error unless they all do.
+    pnr_inputs = [netlist.name, *(c.name for c in constraints)]
+
+    def seeded_pnr(seed):
+        seed_dir = build_dir / f"seed-{seed}"
+        seed_cmds = [
+            _with_seed(cmd, seed) if Path(cmd[0]).name.startswith("nextpnr") else cmd
+            for cmd in pnr_cmds
+        ]
+
+        def place_and_route():
+            seed_dir.mkdir(exist_ok=True)
+            for fn in pnr_inputs:
+                shutil.copyfile(build_dir / fn, seed_dir / fn)
+            status = 0
+            # Kept for when a seed fails; interleaved, they'd be unreadable.
+            with open(seed_dir / "pnr.log", "wb") as log:
+                for cmd in seed_cmds:
+                    if status := subprocess.run(cmd, cwd=seed_dir, stderr=log).returncode:
+                        break
+            (seed_dir / "pnr.status").write_text(str(status))
+
+        place_and_route.__name__ = f"place_and_route(seed={seed})"
+        return cr.add_process(place_and_route,
+            infs=[netlist, *constraints, {"pnr-commands": json.dumps(seed_cmds)}],
+            outf=seed_dir / "pnr.status",
+            artifacts=[f"{np.name}.*", "pnr.status", "pnr.log"])
+
+    seed_cus = [seeded_pnr(seed) for seed in seeds]
+
+    def select():
+        return select_seed(build_dir, np.name, seeds, keep=pnr_inputs)
+
+    select.__name__ = "select_seed"
+    cr.add_process(select,
+        infs=[
+            build_dir / f"seed-{seed}" / fn
+            for seed in seeds for fn in ["pnr.status", f"{np.name}.tim"]
+        ],
+        outf=build_dir / np.name,
+        deps=seed_cus)
+
+
+def select_seed(build_dir: Path, name: str, seeds: list[int], *, keep=()) -> int:
+    """
+    Copy the products of the seed which placed and routed with the best
+    timing from its ``seed-N`` directory into ``build_dir``, and record every
+    seed's results in ``<name>.seeds.json``. Files named in ``keep`` (the
+    inputs) aren't copied. Returns non-zero if every seed failed, leaving no
+    products or results behind.
+    """
+    seeds_path = build_dir / f"{name}.seeds.json"
+    # Whatever a previous selection left mustn't pass for this one's.
+    try:
+        stale = json.loads(seeds_path.read_text()).get("products", [])
+    except (FileNotFoundError, ValueError):
+        stale = []
+    seeds_path.unlink(missing_ok=True)
+    for seed in seeds:
+        stale += [path.name for path in (build_dir / f"seed-{seed}").glob(f"{name}.*")]
+    for fn in set(stale) - set(keep):
+        (build_dir / fn).unlink(missing_ok=True)
+
+    results = []
+    for seed in seeds:
+        seed_dir = build_dir / f"seed-{seed}"
+        status = int((seed_dir / "pnr.status").read_text())
+        fmax = {}
+        if status == 0:
+            fmax = BuildReport.from_logs(nextpnr=seed_dir / f"{name}.tim").fmax
+        results.append({"seed": seed, "status": status, "fmax": fmax, "log": str(seed_dir / "pnr.log")})
+
+    passed = [r for r in results if r["status"] == 0 and r["fmax"]]
+    if not passed:
+        logger.error("place-and-route failed for every seed; see " +
+                     ", ".join(r["log"] for r in results))
+        return 1
+    # The best seed has the most headroom on its tightest clock.
+    best = max(passed, key=lambda r: min(timing.headroom for timing in r["fmax"].values()))
+    seed_dir = build_dir / f"seed-{best['seed']}"
+    products = sorted(path.name for path in seed_dir.glob(f"{name}.*") if path.name not in keep)
+    for fn in products:
+        shutil.copyfile(seed_dir / fn, build_dir / fn)
+    for r in results:
+        r["fmax"] = {clock: timing.achieved_mhz for clock, timing in r["fmax"].items()}
+    seeds_path.write_text(json.dumps({"best": best["seed"], "results": results, "products": products}))
+    return 0
+
+
+def parse_seeds(value: str) -> list[int]:
+    """
+    "N" is the seeds 1 through N; "a,b,c" those seeds specifically.
+    """
+    if "," in value:
+        return [int(seed) for seed in value.split(",") if seed]
+    return list(range(1, int(value) + 1))
+
+
+def _with_seed(cmd, seed: int) -> list[str]:
+    # The plan may already pass one (e.g. from nextpnr_opts); ours wins.
+    cmd = list(cmd)
+    for i, arg in enumerate(cmd):
+        if arg == "--seed" and i + 1 < len(cmd):
+            cmd[i + 1] = str(seed)
+            return cmd
+        if arg.startswith("--seed="):
+            cmd[i] = f"--seed={seed}"
+            return cmd
+    return cmd + ["--seed", str(seed)]
+
+
+def _resolve_tool(cmd):
+    from amaranth._toolchain import tool_env_var
+
+    # As the shell script does with e.g. $NEXTPNR_ICE40.
+    return [os.environ.get(tool_env_var(cmd[0]), cmd[0]), *cmd[1:]]
+
+
+def construct_top(np: Project, platform: "Platform", **kwargs):
+    sig = inspect.signature(np.top)
+    if "platform" in sig.parameters:
+        kwargs["platform"] = platform
+    return np.top(**kwargs)
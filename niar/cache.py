@@ -0,0 +1,99 @@
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from .logging import logger
+
+__all__ = ["ArtifactCache"]
+
+
+class ArtifactCache:
+    """
+    A content-addressed store of what units produce, keyed on their digest.
+    Unlike the digest database, it's shared between build directories and
+    checkouts. Least recently used entries are evicted to stay under
+    ``max_size`` bytes.
+    """
+
+    DEFAULT_SIZE = "5G"
+
+    def __init__(self, directory, *, max_size: int):
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    @classmethod
+    def from_env(cls) -> Optional["ArtifactCache"]:
+        """
+        Use ``NIAR_CACHE_DIR`` if set, limited to ``NIAR_CACHE_SIZE`` (e.g.
+        ``500M``, ``20G``).
+        """
+        if not (directory := os.getenv("NIAR_CACHE_DIR")):
+            return None
+        return cls(directory, max_size=parse_size(os.getenv("NIAR_CACHE_SIZE") or cls.DEFAULT_SIZE))
+
+    def entry(self, key):
+        return self.directory / key[:2] / key
+
+    def restore(self, key, directory) -> bool:
+        entry = self.entry(key)
+        try:
+            names = os.listdir(entry)
+            if not names:
+                return False
+            Path(directory).mkdir(parents=True, exist_ok=True)
+            for name in names:
+                shutil.copyfile(entry / name, Path(directory) / name)
+            # Mark as recently used.
+            os.utime(entry)
+        except FileNotFoundError:
+            # Not there, or evicted while we were copying it.
+            return False
+        return True
+
+    def store(self, key, paths):
+        entry = self.entry(key)
+        # An empty entry would restore nothing and still count as a hit.
+        if not paths or entry.exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=entry.parent, prefix=f".{key}."))
+        for path in paths:
+            shutil.copyfile(path, staging / Path(path).name)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Someone else stored it first.
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in self.directory.glob("??/*"):
+            if entry.name.startswith("."):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime_ns, size, entry))
+            except FileNotFoundError:
+                continue
+            total += size
+
+        entries.sort()
+        for _mtime, size, entry in entries:
+            if total <= self.max_size:
+                break
+            logger.debug("evicting %s from artifact cache", entry.name)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def parse_size(size: str) -> int:
+    match = re.fullmatch(r"\s*(\d+)\s*([KMGT]?)i?B?\s*", size, flags=re.IGNORECASE)
+    if not match:
+        raise ValueError(f"can't parse size {size!r}")
+    return int(match[1]) * 1024 ** " KMGT".index(match[2].upper() or " ")
@@ -1,15 +1,28 @@
+import glob
 import hashlib
 import inspect
+import json
+import os
+import re
 import shlex
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+from . import trace
 from .logging import logger
 
-__all__ = ["CompilationUnit", "CommandRunner", "CommandFailedError"]
+__all__ = [
+    "CompilationUnit", "CommandRunner", "CommandFailedError", "DigestDatabase", "parse_depfile",
+    "write_if_changed",
+]
 
 
 class CompilationUnit:
-    def __init__(self, cmd, *, infs, outf, chdir):
+    def __init__(self, cmd, *, infs, outf, chdir, deps=(), depfile=None, db=None, artifacts=(),
+                 launcher=()):
         if inspect.isfunction(cmd):
             self.cmd = cmd
         else:
@@ -17,25 +30,35 @@ class CompilationUnit:
         self.infs  = infs
         self.outf  = str(outf) if outf else None
         self.chdir = chdir
+        self.deps  = list(deps)
+        # Makefile-style dependency file written by the command (e.g. "-MMD
+        # -MF"); what it lists from the last run is digested with the inputs.
+        self.depfile = str(depfile) if depfile else None
+        self.db = db
+        # Glob patterns, relative to outf's directory, of what the command
+        # produces for storing in the artifact cache.
+        self.artifacts = list(artifacts)
+        # Prefixed to the command when run (e.g. a compiler cache), but not
+        # part of what it's digested as: it doesn't change what's produced.
+        self.launcher = [str(el) for el in launcher]
 
         self.forced = False
-        self.digest_path = f"{outf}.dig"
+        self.digest = None
 
     @property
     def up_to_date(self):
-        if self.outf is None:
-            return False
-        try:
-            with open(self.digest_path, "r") as f:
-                return f.read() == self.digest_ins_with_cmd()
-        except FileNotFoundError:
+        if self.outf is None or self.db is None:
             return False
+        self.digest = self.digest_ins_with_cmd()
+        return self.db.unit_digest(self.outf) == self.digest
 
     def mark_up_to_date(self):
-        if self.outf is None:
+        if self.outf is None or self.db is None:
             return
-        with open(self.digest_path, "w") as f:
-            f.write(self.digest_ins_with_cmd())
+        if self.digest is None or self.depfile is not None:
+            # The depfile may name different inputs now that we've run.
+            self.digest = self.digest_ins_with_cmd()
+        self.db.set_unit_digest(self.outf, self.digest)
 
     def digest_ins_with_cmd(self):
         m = hashlib.sha256()
@@ -54,8 +77,15 @@ class CompilationUnit:
 
         digest_int(len(infs))
         for in_path in sorted(infs.keys()):
-            digest_str(in_path)
-            digest_bytes(infs[in_path])
+            # Relative to the project, so digests match between checkouts.
+            digest_str(os.path.relpath(in_path))
+            if (content := infs[in_path]) is not None:
+                digest_bytes(content)
+            elif (file_digest := self.db.file_digest(in_path)) is not None:
+                digest_str(file_digest)
+            else:
+                # Named by the depfile, but gone now.
+                digest_int(0xffffffff)
 
         if not inspect.isfunction(self.cmd):
             digest_int(len(self.cmd))
@@ -64,7 +94,31 @@ class CompilationUnit:
 
         return m.hexdigest()
 
+    @property
+    def cache_key(self):
+        m = hashlib.sha256()
+        m.update(self.digest.encode())
+        m.update(os.path.relpath(self.outf).encode())
+        if inspect.isfunction(self.cmd):
+            m.update(self.cmd.__qualname__.encode())
+        return m.hexdigest()
+
+    def produced_artifacts(self, since_ns):
+        directory = os.path.dirname(self.outf)
+        inputs = {os.path.abspath(inf) for inf in self.process_infs()}
+        paths = set()
+        for pattern in self.artifacts:
+            for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+                if (os.path.isfile(path) and os.path.abspath(path) not in inputs and
+                        os.stat(path).st_mtime_ns >= since_ns):
+                    paths.add(path)
+        return sorted(paths)
+
     def process_infs(self):
+        """
+        Map each input to its content if given in memory, or to ``None`` if
+        it's a file for the digest database to take care of.
+        """
         r = {}
         for inf in self.infs:
             if isinstance(inf, dict):
@@ -73,25 +127,158 @@ class CompilationUnit:
                         v = v.encode()
                     r[str(k)] = v
             else:
-                with open(inf, "rb") as f:
-                    r[str(inf)] = f.read()
+                r[str(inf)] = None
+        if self.depfile is not None:
+            try:
+                deps = parse_depfile(self.depfile)
+            except FileNotFoundError:
+                deps = []
+            for dep in deps:
+                dep = os.path.join(self.chdir, dep) if self.chdir else dep
+                r.setdefault(dep, None)
         return r
 
 
+class DigestDatabase:
+    """
+    Digests of every unit built into one directory, plus a cache of input
+    file digests keyed on their stat, so unchanged files aren't reread.
+    """
+
+    FILENAME = ".niar-digests.json"
+
+    # Files modified this recently might yet be modified again within the
+    # filesystem's timestamp granularity; don't trust their stat.
+    RACY_NS = 2_000_000_000
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, self.FILENAME)
+        self.lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.units = data["units"]
+            self.files = data["files"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.units = {}
+            self.files = {}
+
+    def unit_digest(self, outf):
+        with self.lock:
+            return self.units.get(outf)
+
+    def set_unit_digest(self, outf, digest):
+        with self.lock:
+            self.units[outf] = digest
+            self.dirty = True
+
+    def file_digest(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = [st.st_size, st.st_mtime_ns, st.st_ino]
+
+        with self.lock:
+            entry = self.files.get(path)
+        if entry is not None and entry[:3] == key:
+            return entry[3]
+
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+
+        with self.lock:
+            if time.time_ns() - st.st_mtime_ns >= self.RACY_NS:
+                self.files[path] = key + [digest]
+            else:
+                self.files.pop(path, None)
+            self.dirty = True
+        return digest
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Other processes may be saving a database here too (e.g. the
+            # shared rtlil-cache with several boards building at once); the
+            # last to finish wins, and the rest only cost rehashing.
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{self.FILENAME}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"units": self.units, "files": self.files}, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self.dirty = False
+
+
+def write_if_changed(path, content):
+    """
+    Write ``content`` to ``path`` unless it's already there, so as not to
+    disturb the stat of unchanged files.
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    try:
+        if os.path.getsize(path) == len(content):
+            with open(path, "rb") as f:
+                if f.read() == content:
+                    return
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def parse_depfile(path):
+    """
+    Return the prerequisites listed in a Makefile-style dependency file, as
+    written by ``-MMD -MF``.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    text = text.replace("\\\n", " ").replace("\\\r\n", " ")
+
+    deps = []
+    for rule in text.splitlines():
+        _target, sep, prereqs = rule.partition(": ")
+        if not sep:
+            continue
+        # Spaces in paths are escaped with a backslash.
+        for dep in re.split(r"(?<!\\) +", prereqs.strip()):
+            if dep:
+                deps.append(dep.replace("\\ ", " ").replace("$$", "$"))
+    return deps
+
+
 class CommandRunner:
     cus: list[CompilationUnit]
 
-    def __init__(self, *, force=False):
+    def __init__(self, *, force=False, jobs=None, cache=None):
         self.cus = []
         self.force = force
-
-    @property
-    def compile_commands(self):
-        return {cu.outf: cu.cmd for cu in self.cus}
-
-    def add_process(self, cmd, *, infs, outf, chdir=None):
-        self.cus.append(
-            CompilationUnit(cmd, infs=infs, outf=outf, chdir=chdir))
+        self.cache = cache
+        self.jobs = jobs or os.cpu_count() or 1
+        self.dbs = {}
+
+    def add_process(self, cmd, *, infs, outf, chdir=None, deps=(), depfile=None, artifacts=(),
+                    launcher=()):
+        cu = CompilationUnit(cmd, infs=infs, outf=outf, chdir=chdir, deps=deps, depfile=depfile,
+                             db=self.database(outf), artifacts=artifacts, launcher=launcher)
+        self.cus.append(cu)
+        return cu
+
+    def database(self, outf):
+        if outf is None:
+            return None
+        directory = os.path.dirname(str(outf))
+        if directory not in self.dbs:
+            self.dbs[directory] = DigestDatabase(directory)
+        return self.dbs[directory]
 
     def run(self, step="compile"):
         self.run_cus(self.cus, step)
@@ -102,31 +289,54 @@ class CommandRunner:
         self.run_cus([cu], step)
 
     def run_cus(self, cus, step):
-        runnables = []
+        # A unit depends on those it names explicitly, and on any unit whose
+        # output it takes as an input.
+        producers = {cu.outf: cu for cu in cus if cu.outf is not None}
+        deps = {}
         for cu in cus:
-            if cu.up_to_date:
-                if self.force:
-                    cu.forced = True
-                    runnables.append([cu, None])
-                else:
-                    self.report(cu, skip=True)
-            else:
-                runnables.append([cu, None])
-
-        for cu_proc in runnables:
-            cu = cu_proc[0]
-            self.report(cu)
-            if inspect.isfunction(cu.cmd):
-                cu.cmd()
-            else:
-                cu_proc[1] = subprocess.Popen(cu.cmd, cwd=cu.chdir)
-
+            deps[cu] = {dep for dep in cu.deps if dep in cus}
+            for inf in cu.infs:
+                if not isinstance(inf, dict) and (dep := producers.get(str(inf))) not in (None, cu):
+                    deps[cu].add(dep)
+
+        pending = list(cus)
+        running = {}
+        done = set()
         failed = []
-        for cu, proc in runnables:
-            if proc is not None:
-                status = proc.wait()
-                if status != 0:
-                    failed.append((cu, status))
+        errors = []
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                while pending or running:
+                    if failed or errors:
+                        # Let what's running finish, but don't start anything new.
+                        pending = []
+                    else:
+                        for cu in [cu for cu in pending if deps[cu] <= done]:
+                            pending.remove(cu)
+                            running[pool.submit(self.run_cu, cu)] = cu
+                    if not running:
+                        if pending:
+                            raise RuntimeError(
+                                "dependency cycle between: " + ", ".join(formatted(cu) for cu in pending))
+                        break
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        cu = running.pop(future)
+                        try:
+                            status = future.result()
+                        except Exception as e:
+                            errors.append(e)
+                            continue
+                        if status != 0:
+                            failed.append((cu, status))
+                        else:
+                            done.add(cu)
+        finally:
+            # Whatever did succeed stays recorded.
+            for db in self.dbs.values():
+                db.save()
 
         if failed:
             logger.error("the following process(es) failed:")
@@ -134,15 +344,59 @@ class CommandRunner:
                 logger.error(f"  {formatted(cu)} (status={status})")
             raise CommandFailedError(f"failed {step} step")
 
-        for cu, _ in runnables:
+        if errors:
+            raise errors[0]
+
+    def run_cu(self, cu):
+        with trace.span(formatted(cu)) as span:
+            span["status"] = status = self.run_cu_traced(cu, span)
+            return status
+
+    def run_cu_traced(self, cu, span):
+        # Called on a worker thread once everything the unit depends on has
+        # completed, so its inputs are final by the time we digest them.
+        if cu.up_to_date:
+            if self.force:
+                cu.forced = True
+            else:
+                self.report(cu, skip=True)
+                span["result"] = "skip"
+                return 0
+
+        use_cache = self.cache is not None and cu.artifacts and cu.digest is not None
+        if use_cache and not self.force:
+            # An entry which didn't have the output in it can't stand in for
+            # running the unit.
+            if (self.cache.restore(cu.cache_key, os.path.dirname(cu.outf)) and
+                    os.path.exists(cu.outf)):
+                self.report(cu, cached=True)
+                span["result"] = "cache"
+                cu.mark_up_to_date()
+                return 0
+
+        self.report(cu)
+        span["result"] = "force" if cu.forced else "run"
+        start_ns = time.time_ns()
+        if inspect.isfunction(cu.cmd):
+            # Functions may return a nonzero status to fail the step.
+            status = cu.cmd() or 0
+        else:
+            status = subprocess.run([*cu.launcher, *cu.cmd], cwd=cu.chdir).returncode
+
+        if status == 0:
             cu.mark_up_to_date()
+            if use_cache:
+                self.cache.store(cu.cache_key, cu.produced_artifacts(start_ns))
+        return status
 
-    def report(self, cu, *, skip=False):
+    def report(self, cu, *, skip=False, cached=False):
         if cu.forced:
             assert(not skip)
             action = "[force]"
         elif skip:
             action = "[skip] "
+        elif cached:
+            action = "[cache]"
         else:
             action = "[run]  "
         logger.info(f"{action} {formatted(cu)}")
@@ -156,7 +410,7 @@ def formatted(cu):
     if inspect.isfunction(cu.cmd):
         return cu.cmd.__name__
 
-    cmd = shlex.join(cu.cmd)
+    cmd = shlex.join([*cu.launcher, *cu.cmd])
     if cu.chdir:
         return f"(in {cu.chdir}/) {cmd}"
     return cmd
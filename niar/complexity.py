@@ -0,0 +1,184 @@
+import json
+from dataclasses import asdict, dataclass, field
+
+from .logging import logger
+
+__all__ = ["DesignComplexity", "ModuleComplexity"]
+
+
+@dataclass
+class ModuleComplexity:
+    """
+    What one RTLIL module contains, not counting the modules it instantiates.
+    """
+
+    cells: dict[str, int] = field(default_factory=dict)
+    wires: int = 0
+    wire_bits: int = 0
+    memories: int = 0
+    memory_bits: int = 0
+    processes: int = 0
+    # Assignments within processes; each is a mux tree or more once lowered.
+    statements: int = 0
+    submodules: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        """
+        A rough proxy for how much work Yosys and the C++ compiler will do.
+        """
+        return sum(self.cells.values()) + self.statements
+
+    def add(self, other: "ModuleComplexity", count: int = 1):
+        for cell, n in other.cells.items():
+            self.cells[cell] = self.cells.get(cell, 0) + n * count
+        self.wires += other.wires * count
+        self.wire_bits += other.wire_bits * count
+        self.memories += other.memories * count
+        self.memory_bits += other.memory_bits * count
+        self.processes += other.processes * count
+        self.statements += other.statements * count
+
+
+class DesignComplexity:
+    """
+    A quick census of the RTLIL emitted for a design, taken without Yosys,
+    to show which modules synthesis and CXXRTL compilation will spend their
+    time on before either starts.
+    """
+
+    def __init__(self, modules: dict[str, ModuleComplexity]):
+        self.modules = modules
+
+    @classmethod
+    def from_rtlil(cls, *paths) -> "DesignComplexity":
+        modules = {}
+        for path in paths:
+            with open(path, "r") as f:
+                modules.update(_parse_rtlil(f))
+        # Only instances of modules we have are hierarchy; anything else is a
+        # cell (a primitive, or a black box).
+        for module in modules.values():
+            for cell in [c for c in module.cells if c in modules]:
+                module.submodules[cell] = module.cells.pop(cell)
+        return cls(modules)
+
+    @property
+    def top(self) -> str:
+        instantiated = {sub for m in self.modules.values() for sub in m.submodules}
+        roots = [name for name in self.modules if name not in instantiated]
+        return roots[0] if roots else next(iter(self.modules))
+
+    def flattened(self, name: str, _memo=None) -> ModuleComplexity:
+        """
+        ``name`` and everything it instantiates, each as many times as it is.
+        """
+        memo = {} if _memo is None else _memo
+        if name not in memo:
+            module = self.modules[name]
+            total = ModuleComplexity()
+            total.add(module)
+            for sub, count in module.submodules.items():
+                total.add(self.flattened(sub, memo), count)
+            memo[name] = total
+        return memo[name]
+
+    def instances(self) -> dict[str, int]:
+        """
+        How many times each module appears in the flattened design.
+        """
+        counts = {name: 0 for name in self.modules}
+
+        def visit(name, count):
+            counts[name] += count
+            for sub, n in self.modules[name].submodules.items():
+                visit(sub, count * n)
+
+        visit(self.top, 1)
+        return counts
+
+    def log(self, *, limit: int = 10):
+        memo = {}
+        total = self.flattened(self.top, memo).size or 1
+        instances = self.instances()
+        logger.debug(f"Design complexity (of {total:,} cells and process statements):")
+        logger.debug(f"  {'own':>8} {'x':>4} {'flat':>8} {'share':>6} {'wire bits':>10} "
+                     f"{'mem bits':>9} {'procs':>6}  module")
+        # Ranked by the share of the design they account for themselves,
+        # across all their instances; that's where the time will go.
+        ranked = sorted(self.modules.items(),
+                        key=lambda item: item[1].size * instances[item[0]], reverse=True)
+        for name, module in ranked[:limit]:
+            share = module.size * instances[name] / total
+            logger.debug(f"  {module.size:>8,} {instances[name]:>4} "
+                         f"{self.flattened(name, memo).size:>8,} {share:>6.1%} "
+                         f"{module.wire_bits:>10,} {module.memory_bits:>9,} "
+                         f"{module.processes:>6,}  {name}")
+        if len(ranked) > limit:
+            logger.debug(f"  ... and {len(ranked) - limit} more modules")
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "top": self.top,
+                "modules": {name: asdict(module) for name, module in self.modules.items()},
+            }, f, indent=2)
+
+
+def _unescape(name: str) -> str:
+    return name[1:] if name.startswith("\\") else name
+
+
+def _option(line: str, name: str, default: int) -> int:
+    # e.g. "wire width 8 input 0 \\a"; options precede the name.
+    words = line.split()
+    try:
+        return int(words[words.index(name) + 1])
+    except (ValueError, IndexError):
+        return default
+
+
+def _parse_rtlil(lines) -> dict[str, ModuleComplexity]:
+    modules = {}
+    module = None
+    # What each "end" closes: "module", "cell", "process" or "switch".
+    blocks = []
+    mem_cell = None
+    for line in lines:
+        tokens = line.split(None, 3)
+        if not tokens:
+            continue
+        match tokens[0]:
+            case "module":
+                module = modules[_unescape(tokens[1])] = ModuleComplexity()
+                blocks.append("module")
+            case "wire" if module is not None:
+                module.wires += 1
+                module.wire_bits += _option(line, "width", 1)
+            case "memory" if module is not None:
+                module.memories += 1
+                module.memory_bits += _option(line, "width", 1) * _option(line, "size", 0)
+            case "cell" if module is not None:
+                cell_type = _unescape(tokens[1])
+                module.cells[cell_type] = module.cells.get(cell_type, 0) + 1
+                if cell_type in ("$mem", "$mem_v2"):
+                    module.memories += 1
+                    mem_cell = {}
+                blocks.append("cell")
+            case "parameter" if mem_cell is not None and tokens[1] in ("\\WIDTH", "\\SIZE"):
+                mem_cell[tokens[1]] = _option(line, tokens[1], 0)
+            case "process" if module is not None:
+                module.processes += 1
+                blocks.append("process")
+            case "switch":
+                blocks.append("switch")
+            case "assign" if module is not None:
+                module.statements += 1
+            case "end" if blocks:
+                match blocks.pop():
+                    case "module":
+                        module = None
+                    case "cell" if mem_cell is not None:
+                        module.memory_bits += mem_cell.get("\\WIDTH", 0) * mem_cell.get("\\SIZE", 0)
+                        mem_cell = None
+    return modules
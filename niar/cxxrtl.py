@@ -1,23 +1,38 @@
 import argparse
+import hashlib
 import json
 import logging
 import os
+import re
+import shlex
 import shutil
+import statistics
+import subprocess
 import sys
+from contextlib import nullcontext
+from dataclasses import dataclass
 from enum import Enum, nonmember
 from functools import partial
 from pathlib import Path
 
-from amaranth._toolchain.yosys import find_yosys
-from amaranth.back import rtlil
-
+from . import trace
 from .build import construct_top
-from .cmdrunner import CommandRunner, CommandFailedError
+from .cmdrunner import CommandRunner, CommandFailedError, CompilationUnit, write_if_changed
+from .complexity import DesignComplexity
+from .cxxrtl_split import split_cxxrtl
+from .cxxrtl_toolchain import LAUNCHERS, LINKERS, CxxToolchain
+from .elaboration import ElaborationCache, elaboration_digest
+from .emit import convert_to_file
 from .logging import logtime, logger
+from .profiling import ElaborationProfile
+from .rtlil_cache import RtlilCache
 from .project import Project
 
 
-__all__ = ["add_arguments"]
+__all__ = ["PIPELINES", "Pipeline", "add_arguments"]
+
+# The testbench support niar compiles into every simulator; see harness.h.
+RUNTIME_DIR = Path(__file__).parent / "cxxrtl_runtime"
 
 CXXFLAGS = [
     "-std=c++17",
@@ -30,6 +45,35 @@ CXXFLAGS = [
 ]
 
 
+@dataclass(frozen=True)
+class Pipeline:
+    """
+    What Yosys does to the design before writing it out as C++. Passes
+    starting with "opt" are only run when optimizing RTL (``-O rtl``).
+    """
+
+    passes: tuple[str, ...] = ("opt",)
+    write_cxxrtl_options: tuple[str, ...] = ()
+
+    def script(self, *, opt_rtl: bool) -> list[str]:
+        return [cmd for cmd in self.passes if opt_rtl or not cmd.startswith("opt")]
+
+
+PIPELINES = {
+    "default": Pipeline(),
+    # Optimize across module boundaries; write_cxxrtl flattens anyway.
+    "flatten": Pipeline(passes=("hierarchy -auto-top", "flatten", "opt")),
+    "proc": Pipeline(passes=("proc", "opt")),
+    "noproc": Pipeline(write_cxxrtl_options=("-noproc",)),
+    "noflatten": Pipeline(write_cxxrtl_options=("-noflatten",)),
+    # write_cxxrtl defaults to -O6, which inlines public wires where it can;
+    # inlining less makes for smaller eval() code, which can run faster. The
+    # levels below these give up on internal wires too, which only costs.
+    "O5": Pipeline(write_cxxrtl_options=("-O5",)),
+    "O4": Pipeline(write_cxxrtl_options=("-O4",)),
+}
+
+
 class _Optimize(Enum):
     rtl = "rtl"
     code = "code"
@@ -96,14 +140,102 @@ def add_arguments(np: Project, parser):
         "-d",
         "--debug",
         action="store_true",
-        help="generate source-level debug information",
+        help="generate source-level debug information, and build the tracing simulator",
     )
     parser.add_argument(
         "-v",
         "--vcd",
         action="store",
         type=str,
-        help="output a VCD file",
+        help="output a VCD file (builds the tracing simulator, with full debug information); "
+             "FST if it ends in .fst (needs vcd2fst)",
+    )
+    parser.add_argument(
+        "--vcd-signals",
+        metavar="GLOBS",
+        help="only record signals matching these comma-separated globs, e.g. 'top.blinker.*'",
+    )
+    parser.add_argument(
+        "--vcd-from",
+        type=int,
+        metavar="TIME",
+        help="only record from this time (in the testbench's time units)",
+    )
+    parser.add_argument(
+        "--vcd-to",
+        type=int,
+        metavar="TIME",
+        help="only record until this time (in the testbench's time units)",
+    )
+    parser.add_argument(
+        "-s",
+        "--split",
+        type=int,
+        default=1,
+        metavar="N",
+        help="compile the generated design as N translation units in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--no-pch",
+        action="store_true",
+        help="don't precompile the CXXRTL runtime and design headers for the testbench",
+    )
+    parser.add_argument(
+        "--pgo",
+        action="store_true",
+        help="optimize with a profile of the simulator run with --pgo-args, and LTO",
+    )
+    parser.add_argument(
+        "--pgo-args",
+        metavar="ARGS",
+        help="arguments to run the simulator with when training it for --pgo",
+    )
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="build and run the simulator with each -O option, comparing build time, size and speed",
+    )
+    parser.add_argument(
+        "--pipeline",
+        choices=PIPELINES,
+        help="Yosys passes and write_cxxrtl options to generate C++ with "
+             "(default: the one found fastest by --tune, or 'default')",
+    )
+    parser.add_argument(
+        "--tune",
+        action="store_true",
+        help="build and run the simulator with each --pipeline, and use the fastest from now on",
+    )
+    parser.add_argument(
+        "--bench-repeat",
+        type=int,
+        default=3,
+        metavar="N",
+        help="how many times to run each simulator for --bench and --tune (default: 3)",
+    )
+    parser.add_argument(
+        "--bench-args",
+        metavar="ARGS",
+        help="arguments to run the simulator with for --bench and --tune",
+    )
+    parser.add_argument(
+        "--bench-cycles",
+        type=int,
+        metavar="N",
+        help="stop each --bench and --tune run after N cycles (with --cycles N, which the "
+             "testbench must honour through niar::bench; see the template's main.cc)",
+    )
+    parser.add_argument(
+        "--launcher",
+        choices=["auto", "none", *LAUNCHERS],
+        default="auto",
+        help="compiler cache to launch compiles through (default: auto, the first found)",
+    )
+    parser.add_argument(
+        "--linker",
+        choices=["auto", "default", *LINKERS],
+        default="auto",
+        help="linker to link with (default: auto, the first found the compiler can use)",
     )
     parser.add_argument(
         "-f",
@@ -111,50 +243,283 @@ def add_arguments(np: Project, parser):
         action="store_true",
         help="don't use cached compilations",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="maximum number of processes to run at once (default: number of cores)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="write a Chrome/Perfetto trace of where the time went",
+    )
+    parser.add_argument(
+        "--profile-elab",
+        action="store_true",
+        help="profile elaboration, reporting time and memory per module (implies re-elaborating)",
+    )
 
 
 def main(np: Project, args):
+    from amaranth._toolchain.yosys import find_yosys
+
+    if args.split < 1:
+        raise RuntimeError("--split must be at least 1")
+    if args.pgo and not args.optimize.opt_code:
+        raise RuntimeError("--pgo needs code optimization (-O code or -O all)")
+    if (args.bench or args.tune) and (args.pgo or args.vcd):
+        raise RuntimeError("--bench and --tune can't be combined with --pgo or --vcd")
+    if args.bench and args.tune:
+        raise RuntimeError("--bench and --tune can't be combined")
+    if args.bench_repeat < 1:
+        raise RuntimeError("--bench-repeat must be at least 1")
+    if args.bench_cycles is not None and not (args.bench or args.tune):
+        raise RuntimeError("--bench-cycles needs --bench or --tune")
+    if args.bench_cycles is not None and args.bench_cycles < 1:
+        raise RuntimeError("--bench-cycles must be at least 1")
+    if not args.vcd and (args.vcd_signals or args.vcd_from is not None or args.vcd_to is not None):
+        raise RuntimeError("--vcd-signals, --vcd-from and --vcd-to need --vcd")
+    fst = args.vcd is not None and args.vcd.endswith(".fst")
+    if fst and not args.compile and shutil.which("vcd2fst") is None:
+        raise RuntimeError("vcd2fst is needed to write FST, and wasn't found")
+
     yosys = find_yosys(lambda ver: ver >= (0, 10))
-    args.force = True # XXX: dependency detection is broken and results in bugs that aren't your fault.
 
     platform = np.cxxrtl_target_by_name(args.target)
-    design = construct_top(np, platform)
+    # Zig testbenches are all their own; niar's harness isn't linked in.
+    if platform.uses_zig and args.bench_cycles is not None:
+        raise RuntimeError("--bench-cycles needs niar::bench, which zig simulators don't have")
+    if platform.uses_zig and (args.vcd_signals or args.vcd_from is not None or args.vcd_to is not None):
+        raise RuntimeError("--vcd-signals, --vcd-from and --vcd-to need niar::waveform_options, "
+                           "which zig simulators don't have")
 
     subdir = type(platform).__name__
     os.makedirs(np.path.build(subdir), exist_ok=True)
 
-    cr = CommandRunner(force=args.force)
+    cr = CommandRunner(force=args.force, jobs=args.jobs)
 
     with logtime(logging.DEBUG, "elaboration"):
         il_path = np.path.build(subdir, f"{np.name}.il")
-        rtlil_text = rtlil.convert(design, name=np.name, platform=platform)
-        with open(il_path, "w") as f:
-            f.write(rtlil_text)
+        elab_cache = ElaborationCache(np.path.build(subdir), elaboration_digest(np, platform))
+        profile = ElaborationProfile() if args.profile_elab else None
+        files = None if args.force or profile else elab_cache.load()
+        if files is not None:
+            logger.debug("design unchanged since last elaboration; reusing it")
+            module_paths = [np.path.build(subdir, fn) for fn in files if fn != il_path.name]
+        else:
+            with (profile(np.name) if profile else nullcontext(),
+                  elab_cache.recording(exclude=np.path.build())):
+                design = construct_top(np, platform)
+                with RtlilCache(np.path.build("rtlil-cache"), force=args.force) as rtlil_cache:
+                    with trace.span("rtlil.convert"):
+                        convert_to_file(design, il_path, name=np.name, platform=platform)
+            if profile:
+                profile.log()
+                profile.save(np.path.build(subdir, "elaboration"))
+            # Separately converted modules of @cache_rtlil components.
+            module_paths = []
+            for name, module_text in rtlil_cache.modules.items():
+                module_paths.append(np.path.build(subdir, f"{name}.il"))
+                write_if_changed(module_paths[-1], module_text)
+            elab_cache.save([il_path.name, *(path.name for path in module_paths)])
+
+        complexity = DesignComplexity.from_rtlil(il_path, *module_paths)
+        complexity.log()
+        complexity.save(np.path.build(subdir, f"{np.name}.complexity.json"))
 
-        cxxrtl_cc_path = np.path.build(subdir, f"{np.name}.cc")
-        yosys_script_path = _make_yosys_relative(np.path.build(subdir, f"{np.name}.ys"))
-        black_boxes = {}
         externals_paths = []
+        for p in np.externals:
+            target = np.path.build(subdir, "externals", p)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(np.path(p), 'rb') as r:
+                target.write_bytes(r.read())
+            externals_paths.append(target)
+
+    toolchain = CxxToolchain.detect(zig=platform.uses_zig, launcher=args.launcher,
+                                    linker=args.linker)
+    logger.debug(f"C++ toolchain: {shlex.join(toolchain.cxx)}, "
+                 f"compiler cache: {toolchain.launcher or 'none'}, "
+                 f"linker: {toolchain.linker or 'default'}")
+    # Tracing needs the design's debug information in full; nothing else
+    # does. Each variant is built in a directory of its own, so switching
+    # between them doesn't rebuild either.
+    variant = "trace" if args.vcd or args.debug else "fast"
+    variant_dir = np.path.build(subdir, variant)
+    logger.debug(f"building the {variant} simulator")
+    builder = _SimulatorBuilder(np, args, cr, platform, yosys, toolchain,
+        rtlil_paths=[*module_paths, il_path],
+        externals_paths=externals_paths,
+        debug_level=_debug_level(variant, platform))
+
+    pipeline_path = np.path.build(subdir, "pipeline.json")
+    if args.bench or args.tune:
+        if args.tune:
+            variants = {
+                name: (args.optimize.opt_rtl, args.optimize.opt_code, name)
+                for name in PIPELINES
+            }
+        else:
+            pipeline = args.pipeline or _tuned_pipeline(pipeline_path)
+            variants = {
+                str(optimize): (optimize.opt_rtl, optimize.opt_code, pipeline)
+                for optimize in _Optimize
+            }
+        try:
+            results = _compare(np, args, builder, variant_dir / ("tune" if args.tune else "bench"), variants,
+                keep_going=args.tune)
+        except CommandFailedError:
+            logger.log(logging.INFO, "aborting on CommandFailedError")
+            return
+        if args.tune:
+            if not results:
+                raise RuntimeError("no pipeline produced a working simulator")
+            fastest = min(results, key=lambda name: _sim_seconds(results[name]))
+            logger.info(f"Fastest pipeline: {fastest}; using it for {subdir} from now on")
+            with open(pipeline_path, "w") as f:
+                json.dump({"pipeline": fastest, "optimize": str(args.optimize)}, f)
+        return
+
+    pipeline = args.pipeline or _tuned_pipeline(pipeline_path)
+    if pipeline != "default" and not args.pipeline:
+        logger.info(f"using pipeline {pipeline!r}, found fastest by --tune")
+
+    # Everything from here on is a single dependency graph: the generated
+    # design and the testbench compile in parallel, and the link waits on both.
+    with logtime(logging.DEBUG, "compilation"):
+        try:
+            design = builder.add_design(variant_dir,
+                opt_rtl=args.optimize.opt_rtl,
+                pipeline=pipeline)
+
+            pgo_cxxflags, pgo_ldflags, pgo_infs = [], [], []
+            if args.pgo:
+                with logtime(logging.DEBUG, "profile-guided optimization"):
+                    # The profile is keyed on the generated design; make it.
+                    builder.run()
+                    pgo_cxxflags, pgo_ldflags, pgo_infs = _train(np, args, builder, design, variant_dir)
+
+            exe_o_path, compile_commands = builder.add_simulator(variant_dir, design,
+                opt_code=args.optimize.opt_code,
+                extra_cxxflags=pgo_cxxflags,
+                extra_ldflags=pgo_ldflags,
+                extra_infs=pgo_infs)
+
+            # Not feasible to do these per-CXXRTL platform, as clangd won't find
+            # them (and how could it know which to choose?). Worth noting it checks
+            # inside a directory named "build" specifically.
+            with open(np.path.build("compile_commands.json"), "w") as f:
+                json.dump(compile_commands, f)
+
+            builder.run()
+        except CommandFailedError:
+            logger.log(logging.INFO, "aborting on CommandFailedError")
+            return
+
+    if not args.compile:
+        cmd = [exe_o_path]
+        if args.vcd:
+            # The simulator only writes VCD; it's converted once it's done.
+            vcd_path = Path(args.vcd).with_suffix(".vcd") if fst else args.vcd
+            cmd += ["--vcd", vcd_path]
+            if args.vcd_signals:
+                cmd += ["--vcd-signals", args.vcd_signals]
+            if args.vcd_from is not None:
+                cmd += ["--vcd-from", str(args.vcd_from)]
+            if args.vcd_to is not None:
+                cmd += ["--vcd-to", str(args.vcd_to)]
+        with logtime(logging.DEBUG, "run"):
+            try:
+                cr.run_cmd(cmd, step="run")
+            except KeyboardInterrupt:
+                print(file=sys.stderr)
+                logger.log(logging.INFO, "aborting on KeyboardInterrupt")
+            except CommandFailedError:
+                logger.log(logging.INFO, "aborting on CommandFailedError")
+        # Even when the simulation failed: that's when the waveform's wanted.
+        if fst and os.path.exists(vcd_path):
+            with logtime(logging.DEBUG, "FST conversion"):
+                try:
+                    cr.run_cmd(["vcd2fst", vcd_path, args.vcd], step="fst")
+                except CommandFailedError:
+                    logger.log(logging.INFO, f"FST conversion failed; the VCD is at {vcd_path}")
+                else:
+                    os.remove(vcd_path)
+
+
+@dataclass
+class _Design:
+    # The C++ as written by Yosys, and what's compiled (the same, unless split).
+    cc_path: Path
+    h_path: Path
+    cc_paths: list[Path]
+    cu: CompilationUnit
+
+
+class _SimulatorBuilder:
+    """
+    Adds the units generating C++ from the elaborated design, and compiling
+    and linking it with the testbench, to a :class:`CommandRunner`. Each
+    variant of the simulator is built in a directory of its own.
+    """
+
+    def __init__(self, np: Project, args, cr: CommandRunner, platform, yosys,
+                 toolchain: CxxToolchain, *, rtlil_paths, externals_paths, debug_level):
+        self.np = np
+        self.args = args
+        self.cr = cr
+        self.platform = platform
+        self.yosys = yosys
+        self.toolchain = toolchain
+        self.rtlil_paths = rtlil_paths
+        self.externals_paths = externals_paths
+        self.debug_level = debug_level
+        self.testbench_cc_paths = list(np.path("cxxrtl").glob("**/*.cc"))
+        # Zig testbenches have no use for it.
+        self.runtime_cc_paths = [] if platform.uses_zig else sorted(RUNTIME_DIR.glob("**/*.cc"))
+
+    def cxxflags(self, *, opt_code: bool) -> list[str]:
+        cxxflags = CXXFLAGS + [
+            f"-DCLOCK_HZ={int(self.platform.default_clk_frequency)}",
+            *(["-O3"] if opt_code else ["-O0"]),
+            *(["-g"] if self.args.debug else []),
+        ]
+        if self.platform.uses_zig:
+            cxxflags += [
+                "-DCXXRTL_INCLUDE_CAPI_IMPL",
+                "-DCXXRTL_INCLUDE_VCD_CAPI_IMPL",
+            ]
+        return cxxflags
+
+    def add_design(self, directory: Path, *, opt_rtl: bool, pipeline: str) -> _Design:
+        np, cr, yosys = self.np, self.cr, self.yosys
+        directory.mkdir(parents=True, exist_ok=True)
+
+        cxxrtl_cc_path = directory / f"{np.name}.cc"
+        cxxrtl_h_path = cxxrtl_cc_path.with_suffix(".h")
+        # Yosys writes here first, so that regenerating identical C++ doesn't
+        # touch what the compiles depend on.
+        staging_cc_path = directory / "staging" / f"{np.name}.cc"
+        staging_cc_path.parent.mkdir(exist_ok=True)
+        yosys_script_path = _make_yosys_relative(directory / f"{np.name}.ys")
 
         with open(yosys_script_path, "w") as f:
-            for box_source in black_boxes.values():
-                f.write(f"read_rtlil <<rtlil\n{box_source}\nrtlil\n")
-            for p in np.externals:
-                target = np.path.build(subdir, "externals", p)
-                target.parent.mkdir(parents=True, exist_ok=True)
-                with open(np.path(p), 'rb') as r:
-                    target.write_bytes(r.read())
-                externals_paths.append(target)
-                f.write(f"read_verilog {_make_yosys_relative(target)}\n")
-            f.write(f"read_rtlil {_make_yosys_relative(il_path)}\n")
-            if args.optimize.opt_rtl:
-                f.write("opt\n")
-                f.write(f"write_rtlil {_make_yosys_relative(il_path)}.opt\n")
+            for path in self.externals_paths:
+                f.write(f"read_verilog {_make_yosys_relative(path)}\n")
+            for path in self.rtlil_paths:
+                f.write(f"read_rtlil {_make_yosys_relative(path)}\n")
+            for cmd in PIPELINES[pipeline].script(opt_rtl=opt_rtl):
+                f.write(f"{cmd}\n")
+            if opt_rtl:
+                f.write(f"write_rtlil {_make_yosys_relative(directory / np.name)}.il.opt\n")
             else:
                 # Allow apples-to-apples comparison of generated RTLIL by
                 # rewriting it with Yosys.
-                f.write(f"write_rtlil {_make_yosys_relative(il_path)}.noopt\n")
-            f.write(f"write_cxxrtl -header {_make_yosys_relative(cxxrtl_cc_path)}\n")
+                f.write(f"write_rtlil {_make_yosys_relative(directory / np.name)}.il.noopt\n")
+            options = " ".join(["-header", f"-g{self.debug_level}",
+                                *PIPELINES[pipeline].write_cxxrtl_options])
+            f.write(f"write_cxxrtl {options} {_make_yosys_relative(staging_cc_path)}\n")
 
         def rtlil_to_cc():
             # "opt" without "proc" generates a bunch of warnings like:
@@ -177,117 +542,394 @@ def main(np: Project, args):
             #
             # Presumably "proc" does it worse, for CXXRTL's purposes.
             yosys.run(["-q", yosys_script_path], ignore_warnings=True)
-
-        cr.add_process(rtlil_to_cc,
-            infs=[il_path, yosys_script_path] + externals_paths,
+            for staged, path in [
+                (staging_cc_path, cxxrtl_cc_path),
+                (staging_cc_path.with_suffix(".h"), cxxrtl_h_path),
+            ]:
+                write_if_changed(path, staged.read_bytes())
+
+        rtlil_to_cc_cu = cr.add_process(rtlil_to_cc,
+            infs=[yosys_script_path, *self.rtlil_paths, *self.externals_paths],
             outf=cxxrtl_cc_path)
-        cr.run()
 
-    with logtime(logging.DEBUG, "compilation"):
-        cc_odep_paths = {cxxrtl_cc_path: (np.path.build(subdir, f"{np.name}.o"), [])}
-        depfs = list(np.path("cxxrtl").glob("**/*.h")) # XXX: the actual part that instantiates the top-level will depend on its .h and doesn't update. We need actual dependency tracking.
-        for path in np.path("cxxrtl").glob("**/*.cc"):
-            # XXX: we make no effort to distinguish cxxrtl/a.cc and cxxrtl/dir/a.cc.
-            cc_odep_paths[path] = (np.path.build(subdir, f"{path.stem}.o"), depfs)
+        split = self.args.split
+        if split > 1:
+            cc_paths = [directory / f"{np.name}.{i}.cc" for i in range(split)]
 
-        cxxflags = CXXFLAGS + [
-            f"-DCLOCK_HZ={int(platform.default_clk_frequency)}",
-            *(["-O3"] if args.optimize.opt_code else ["-O0"]),
-            *(["-g"] if args.debug else []),
+            def split_cc():
+                shards = split_cxxrtl(cxxrtl_cc_path.read_text(), len(cc_paths))
+                for path, shard in zip(cc_paths, shards):
+                    write_if_changed(path, shard)
+
+            design_cu = cr.add_process(split_cc,
+                infs=[cxxrtl_cc_path, {"split": str(split)}],
+                outf=cc_paths[0],
+                deps=[rtlil_to_cc_cu])
+        else:
+            cc_paths = [cxxrtl_cc_path]
+            design_cu = rtlil_to_cc_cu
+
+        return _Design(cc_path=cxxrtl_cc_path, h_path=cxxrtl_h_path, cc_paths=cc_paths, cu=design_cu)
+
+    def add_simulator(self, directory: Path, design: _Design, *, opt_code: bool,
+                      extra_cxxflags=(), extra_ldflags=(), extra_infs=(), pch=True):
+        """
+        Add compiling ``design`` and the testbench into ``directory``, and
+        linking them. Returns where the simulator will be, and its compile
+        commands.
+        """
+        np, cr, toolchain, platform = self.np, self.cr, self.toolchain, self.platform
+        directory.mkdir(parents=True, exist_ok=True)
+        cxxflags = [*self.cxxflags(opt_code=opt_code), *extra_cxxflags]
+        includes = [
+            f"-I{design.h_path.parent}",
+            f"-I{self.yosys.data_dir() / "include" / "backends" / "cxxrtl" / "runtime"}",
+            f"-I{RUNTIME_DIR}",
         ]
-        if platform.uses_zig:
-            cxxflags += [
-                "-DCXXRTL_INCLUDE_CAPI_IMPL",
-                "-DCXXRTL_INCLUDE_VCD_CAPI_IMPL",
-            ]
 
-        for cc_path, (o_path, dep_paths) in cc_odep_paths.items():
+        cc_o_paths = {}
+        for path in design.cc_paths + self.testbench_cc_paths:
+            # XXX: we make no effort to distinguish cxxrtl/a.cc and cxxrtl/dir/a.cc.
+            cc_o_paths[path] = directory / f"{path.stem}.o"
+        for path in self.runtime_cc_paths:
+            cc_o_paths[path] = directory / f"niar_{path.stem}.o"
+
+        # The testbench's translation units all parse the CXXRTL runtime and
+        # the design header; parse them once.
+        pch_cu = None
+        if pch and not self.args.no_pch and self.testbench_cc_paths:
+            pch_h_path = directory / "cxxrtl_pch.h"
+            write_if_changed(pch_h_path, "".join([
+                "#include <cxxrtl/cxxrtl.h>\n",
+                "#include <cxxrtl/cxxrtl_vcd.h>\n",
+                *(["#include <niar/harness.h>\n"] if self.runtime_cc_paths else []),
+                f'#include "{design.h_path.name}"\n',
+            ]))
+            pch_path = pch_h_path.with_name(pch_h_path.name + toolchain.pch_suffix())
+            d_path = pch_h_path.with_suffix(".d")
+            cmd = [
+                *toolchain.cxx,
+                *cxxflags,
+                *includes,
+                "-MMD",
+                "-MF",
+                d_path,
+                "-x",
+                "c++-header",
+                pch_h_path,
+                "-o",
+                pch_path,
+            ]
+            pch_cu = cr.add_process(cmd,
+                infs=[pch_h_path, *extra_infs],
+                outf=pch_path,
+                deps=[design.cu],
+                depfile=d_path,
+                launcher=toolchain.compile_launcher())
+
+        compile_commands = []
+        for cc_path, o_path in cc_o_paths.items():
+            # Headers included are picked up from the depfile after the first
+            # compile. That includes the generated header, which is why
+            # everything waits on the Yosys step; niar's runtime doesn't
+            # include it, so needn't.
+            d_path = o_path.with_suffix(".d")
+            infs = [cc_path, *extra_infs]
+            runtime = cc_path in self.runtime_cc_paths
+            deps = [] if runtime else [design.cu]
+            pch_flags = []
+            if pch_cu is not None and cc_path not in design.cc_paths and not runtime:
+                pch_flags = toolchain.pch_flags(pch_h_path)
+                infs.append(pch_path)
+                deps.append(pch_cu)
             cmd = [
-                "c++",
+                *toolchain.cxx,
                 *cxxflags,
-                f"-I{np.path.build(subdir)}",
-                f"-I{yosys.data_dir() / "include" / "backends" / "cxxrtl" / "runtime"}",
+                *includes,
+                *pch_flags,
+                "-MMD",
+                "-MF",
+                d_path,
                 "-c",
                 cc_path,
                 "-o",
-                o_path,
+                # GCC only strips -fprofile-prefix-path from relative paths.
+                os.path.relpath(o_path),
             ]
-            if platform.uses_zig:
-                cmd = ["zig"] + cmd
-            cr.add_process(cmd, infs=[cc_path] + dep_paths, outf=o_path)
-
-        # Not feasible to do these per-CXXRTL platform, as clangd won't find
-        # them (and how could it know which to choose?). Worth noting it checks
-        # inside a directory named "build" specifically.
-        with open(np.path.build("compile_commands.json"), "w") as f:
-            json.dump(
-                [{
-                    "directory": str(np.path()),
-                    "file": file,
-                    "arguments": arguments,
-                } for file, arguments in cr.compile_commands.items()],
-                f,
-            )
-
-        cr.run()
-
-        exe_o_path = np.path.build(subdir, np.name)
-        cc_o_paths = [o_path for (o_path, _) in cc_odep_paths.values()]
+            cr.add_process(cmd,
+                infs=infs,
+                outf=o_path,
+                deps=deps,
+                depfile=d_path,
+                launcher=toolchain.compile_launcher(pch=bool(pch_flags)))
+            compile_commands.append({
+                "directory": str(np.path()),
+                "file": str(cc_path),
+                "output": str(o_path),
+                "arguments": [str(arg) for arg in cmd],
+            })
+
+        exe_o_path = directory / np.name
+        o_paths = list(cc_o_paths.values())
         if platform.uses_zig:
             # Note that we don't clear zig's cache on args.force.
             cmd = [
                 "zig",
                 "build",
                 f"-Dclock_hz={int(platform.default_clk_frequency)}",
-                f"-Dyosys_data_dir={yosys.data_dir()}",
+                f"-Dyosys_data_dir={self.yosys.data_dir()}",
             ] + [
                 # Zig really wants relative paths.
-                f"-Dcxxrtl_o_path=../{p.relative_to(np.path())}" for p in cc_o_paths
+                f"-Dcxxrtl_o_path=../{p.relative_to(np.path())}" for p in o_paths
             ]
-            if args.optimize.opt_code:
+            if opt_code:
                 cmd += ["-Doptimize=ReleaseFast"]
             outf = "cxxrtl/zig-out/bin/cxxrtl"
-            cr.add_process(cmd,
-                infs=cc_o_paths + list(np.path("cxxrtl").glob("**/*.zig")),
+            zig_cu = cr.add_process(cmd,
+                infs=o_paths + list(np.path("cxxrtl").glob("**/*.zig")),
                 outf=outf,
                 chdir="cxxrtl")
-            try:
-                cr.run()
-            except CommandFailedError:
-                logger.log(logging.INFO, "aborting on CommandFailedError")
-                return
-            shutil.copy(outf, exe_o_path)
+
+            def copy_simulator():
+                shutil.copy(outf, exe_o_path)
+
+            cr.add_process(copy_simulator,
+                infs=[outf],
+                outf=exe_o_path,
+                deps=[zig_cu])
         else:
             cmd = [
-                "c++",
+                *toolchain.cxx,
+                *toolchain.link_flags(),
                 # Hard to imagine these flags having any effect.
-                *(["-O3"] if args.optimize.opt_code else ["-O0"]),
-                *(["-g"] if args.debug else []),
-                *cc_o_paths,
+                *(["-O3"] if opt_code else ["-O0"]),
+                *(["-g"] if self.args.debug else []),
+                *extra_ldflags,
+                *o_paths,
                 "-o",
                 exe_o_path,
             ]
             cr.add_process(cmd,
-                infs=cc_o_paths,
+                infs=[*o_paths, *extra_infs],
                 outf=exe_o_path)
-            try:
-                cr.run()
-            except CommandFailedError:
-                logger.log(logging.INFO, "aborting on CommandFailedError")
-                return
 
-    if not args.compile:
-        cmd = [exe_o_path]
-        if args.vcd:
-            cmd += ["--vcd", args.vcd]
-        with logtime(logging.DEBUG, "run"):
-            try:
-                cr.run_cmd(cmd, step="run")
-            except KeyboardInterrupt:
-                print(file=sys.stderr)
-                logger.log(logging.INFO, "aborting on KeyboardInterrupt")
-            except CommandFailedError:
-                logger.log(logging.INFO, "aborting on CommandFailedError")
+        return exe_o_path, compile_commands
+
+    def run(self):
+        cache_stats = self.toolchain.cache_stats()
+        try:
+            self.cr.run()
+        finally:
+            self.toolchain.log_cache_stats(cache_stats)
+
+
+def _train(np: Project, args, builder: _SimulatorBuilder, design: _Design, directory: Path):
+    """
+    Build an instrumented simulator and run it with ``--pgo-args``, unless
+    the profile from the last time was of the same sources, flags and
+    arguments. Returns the flags to compile and link with to use it, and
+    what to digest with them to rebuild when it changes.
+    """
+    cr, toolchain = builder.cr, builder.toolchain
+    if builder.platform.uses_zig:
+        raise RuntimeError("--pgo isn't supported with zig")
+
+    pgo_dir = directory / "pgo"
+    profile_dir = pgo_dir / "profile"
+    generate_dir = pgo_dir / "generate"
+    manifest_path = pgo_dir / "pgo.json"
+    training_args = shlex.split(args.pgo_args or "")
+
+    if toolchain.is_clang:
+        profile = profile_dir / "default.profdata"
+        generate_flags = [f"-fprofile-generate={profile_dir}"]
+        use_flags = [
+            f"-fprofile-use={profile}",
+            "-Wno-profile-instr-unprofiled",
+            "-Wno-profile-instr-out-of-date",
+        ]
+        lto_flags = ["-flto=thin"]
+    else:
+        # GCC names each object's profile after its path, less these prefixes.
+        generate_flags = [f"-fprofile-generate={profile_dir}", f"-fprofile-prefix-path={generate_dir}"]
+        use_flags = [
+            f"-fprofile-use={profile_dir}",
+            f"-fprofile-prefix-path={directory}",
+            # Don't optimize what training didn't reach for size.
+            "-fprofile-partial-training",
+            "-Wno-missing-profile",
+        ]
+        lto_flags = ["-flto=auto"]
+
+    digest = _digest(design.cc_path, *builder.testbench_cc_paths, *builder.runtime_cc_paths,
+                     extra=[toolchain.cxx, builder.cxxflags(opt_code=True), generate_flags, use_flags,
+                            training_args])
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (FileNotFoundError, ValueError):
+        manifest = None
+    if args.force or manifest is None or manifest.get("digest") != digest:
+        logger.info("training the simulator for profile-guided optimization")
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        profile_dir.mkdir(parents=True)
+        exe_path, _ = builder.add_simulator(generate_dir, design,
+            opt_code=True,
+            extra_cxxflags=generate_flags,
+            extra_ldflags=[f"-fprofile-generate={profile_dir}"],
+            pch=False)
+        builder.run()
+        cr.run_cmd([exe_path, *training_args], step="pgo")
+        if toolchain.is_clang:
+            if (llvm_profdata := shutil.which("llvm-profdata")) is None:
+                raise RuntimeError("llvm-profdata is needed to use clang's profiles, and wasn't found")
+            cr.run_cmd([llvm_profdata, "merge", "-o", profile, *profile_dir.glob("*.profraw")],
+                       step="pgo")
+        # Also what the compiles and link digest, so they're redone.
+        manifest_path.write_text(json.dumps({
+            "digest": digest,
+            "profile": _digest(*sorted(path for path in profile_dir.rglob("*") if path.is_file())),
+        }))
+    else:
+        logger.debug("sources unchanged since the simulator was last trained; reusing its profile")
+
+    return [*use_flags, *lto_flags], lto_flags, [manifest_path]
+
+
+def _compare(np: Project, args, builder: _SimulatorBuilder, kind_dir: Path, variants,
+             *, keep_going=False):
+    """
+    Build each variant of the simulator, given as ``name: (opt_rtl,
+    opt_code, pipeline)``, into ``kind_dir/<name>/``, run each
+    ``--bench-repeat`` times, and tabulate what each costs to build against
+    how fast it runs. Returns the results, as also written to
+    ``kind_dir/results.json``. With ``keep_going``, variants
+    which fail to build or run are left out rather than aborting.
+    """
+    bench_args = shlex.split(args.bench_args or "")
+    if args.bench_cycles is not None:
+        bench_args += ["--cycles", str(args.bench_cycles)]
+    results = {}
+    for name, (opt_rtl, opt_code, pipeline) in variants.items():
+        directory = kind_dir / name
+        try:
+            build_seconds, runs, cycles, sim_seconds = _build_and_run(np, args, builder, directory, bench_args,
+                                                         name, opt_rtl, opt_code, pipeline)
+        except CommandFailedError:
+            if not keep_going:
+                raise
+            logger.warning(f"{name} failed; leaving it out")
+            continue
+
+        results[name] = {
+            "build_seconds": build_seconds,
+            "size": (directory / np.name).stat().st_size,
+            "run_seconds": runs,
+            "cycles": cycles,
+            "sim_seconds": sim_seconds,
+        }
+
+    with open(kind_dir / "results.json", "w") as f:
+        json.dump(results, f, indent=2)
+
+    if not results:
+        return results
+    width = max(len(name) for name in results)
+    logger.info(f"Build and {args.bench_repeat} run(s) of each:")
+    logger.info(f"  {'':<{width}} {'build':>8} {'size':>10} {'run (mean ± sd)':>18} {'cycles/s':>12}")
+    for name, result in results.items():
+        runs = result["run_seconds"]
+        mean = statistics.mean(runs)
+        sd = statistics.stdev(runs) if len(runs) > 1 else 0.0
+        sim = _sim_seconds(result)
+        rate = f"{result['cycles'] / sim:>12,.0f}" if result["cycles"] and sim else f"{'?':>12}"
+        logger.info(f"  {name:<{width}} {result['build_seconds']:>7.1f}s "
+                    f"{result['size'] / 2**20:>6.2f} MiB {mean:>9.3f}s ± {sd:<6.3f} {rate}")
+
+    return results
+
+
+def _build_and_run(np: Project, args, builder: _SimulatorBuilder, directory: Path, bench_args,
+                   name, opt_rtl, opt_code, pipeline):
+    exe_path = directory / np.name
+    times_path = directory / "bench.json"
+    mtime_ns = _mtime_ns(exe_path)
+
+    with logtime(logging.DEBUG, f"building {name}") as building:
+        design = builder.add_design(directory, opt_rtl=opt_rtl, pipeline=pipeline)
+        exe_path, _ = builder.add_simulator(directory, design, opt_code=opt_code)
+        builder.run()
+    # If nothing needed building, the time it took when it last did.
+    if _mtime_ns(exe_path) != mtime_ns or not times_path.exists():
+        build_seconds = building.elapsed.total_seconds()
+        times_path.write_text(json.dumps({"build_seconds": build_seconds}))
+    else:
+        build_seconds = json.loads(times_path.read_text())["build_seconds"]
+
+    runs = []
+    sim_seconds = []
+    cycles = None
+    for repetition in range(args.bench_repeat):
+        with logtime(logging.DEBUG, f"running {name} ({repetition + 1})") as running:
+            result = subprocess.run([exe_path, *bench_args], stdout=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            sys.stdout.write(result.stdout)
+            raise CommandFailedError(f"{exe_path} failed with status {result.returncode}")
+        runs.append(running.elapsed.total_seconds())
+        if m := _FINISHED.findall(result.stdout):
+            cycles = int(m[-1][0])
+            if m[-1][1]:
+                sim_seconds.append(float(m[-1][1]))
+    if args.bench_cycles is not None and cycles is not None and cycles < args.bench_cycles:
+        logger.warning(f"{name} finished on cycle {cycles}, before --bench-cycles {args.bench_cycles}")
+    return build_seconds, runs, cycles, sim_seconds
+
+
+def _sim_seconds(result) -> float:
+    # Where the testbench timed its own simulation, that's without start-up
+    # (constructing the design, opening files) and teardown.
+    return statistics.mean(result["sim_seconds"] or result["run_seconds"])
+
+
+def _debug_level(variant: str, platform) -> int:
+    if variant == "trace":
+        # Everything, including public wires optimized out.
+        return 4
+    # The bare minimum to reach all design state; the C API, through which
+    # zig testbenches find their signals by name, also wants the public
+    # wires the C++ interface has.
+    return 2 if platform.uses_zig else 1
+
+
+def _tuned_pipeline(path) -> str:
+    try:
+        with open(path, "r") as f:
+            pipeline = json.load(f)["pipeline"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return "default"
+    # It may have been recorded by a version with other presets.
+    return pipeline if pipeline in PIPELINES else "default"
+
+
+# Printed by the testbench when it's done, by niar::bench::finish with how
+# long the simulation took; see the template's main.cc.
+_FINISHED = re.compile(r"^finished on cycle (\d+)(?: in ([0-9.e+-]+) s)?$", re.MULTILINE)
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _digest(*paths, extra=()) -> str:
+    m = hashlib.sha256()
+    for path in paths:
+        m.update(str(path).encode() + b"\0")
+        with open(path, "rb") as f:
+            m.update(hashlib.file_digest(f, "sha256").digest())
+    m.update(json.dumps(extra, default=str).encode())
+    return m.hexdigest()
 
 
 def _make_yosys_relative(path):
@@ -0,0 +1,128 @@
+#include <cstdlib>
+#include <cstring>
+#include <iostream>
+
+#include <niar/harness.h>
+
+namespace niar {
+
+static const char *option_value(int argc, char **argv, int &i) {
+  if (i + 1 >= argc) {
+    std::cerr << argv[i] << " needs a value" << std::endl;
+    std::exit(2);
+  }
+  return argv[++i];
+}
+
+static uint64_t parse_count(const char *option, const char *what, const char *value) {
+  char *end;
+  uint64_t count = std::strtoull(value, &end, 10);
+  if (*value == '\0' || *end != '\0') {
+    std::cerr << option << " expects " << what << ", not \"" << value << "\"" << std::endl;
+    std::exit(2);
+  }
+  return count;
+}
+
+bool waveform_options::parse(int argc, char **argv, int &i) {
+  const char *option = argv[i];
+  if (strcmp(option, "--vcd") == 0) {
+    path = option_value(argc, argv, i);
+  } else if (strcmp(option, "--vcd-signals") == 0) {
+    std::string globs = option_value(argc, argv, i);
+    size_t start = 0;
+    while (start <= globs.size()) {
+      size_t end = globs.find(',', start);
+      if (end == std::string::npos)
+        end = globs.size();
+      if (end > start)
+        signals.push_back(globs.substr(start, end - start));
+      start = end + 1;
+    }
+  } else if (strcmp(option, "--vcd-from") == 0) {
+    from = parse_count(option, "a time", option_value(argc, argv, i));
+  } else if (strcmp(option, "--vcd-to") == 0) {
+    to = parse_count(option, "a time", option_value(argc, argv, i));
+  } else {
+    return false;
+  }
+  return true;
+}
+
+bool waveform_writer::open(const waveform_options &options,
+                           const cxxrtl::debug_items &items) {
+  this->options = options;
+  if (!options.path.has_value())
+    return true;
+  out.open(*options.path, std::ios::binary | std::ios::trunc);
+  if (!out.is_open())
+    return false;
+  flushed = std::chrono::steady_clock::now();
+
+  vcd.add(items, [&](const std::string &name, const cxxrtl::debug_item &) {
+    if (options.signals.empty())
+      return true;
+    // CXXRTL separates the levels of hierarchy with spaces.
+    std::string dotted = name;
+    for (auto &c : dotted)
+      if (c == ' ')
+        c = '.';
+    for (auto &glob : options.signals)
+      if (glob_match(glob.c_str(), dotted.c_str()))
+        return true;
+    return false;
+  });
+  return true;
+}
+
+void waveform_writer::flush() {
+  if (!out.is_open())
+    return;
+  out.write(vcd.buffer.data(), vcd.buffer.size());
+  out.flush();
+  vcd.buffer.clear();
+  flushed = std::chrono::steady_clock::now();
+}
+
+void waveform_writer::close() {
+  flush();
+  if (out.is_open())
+    out.close();
+}
+
+bool bench::parse(int argc, char **argv, int &i) {
+  const char *option = argv[i];
+  if (strcmp(option, "--cycles") != 0)
+    return false;
+  cycles = parse_count(option, "a number of cycles", option_value(argc, argv, i));
+  return true;
+}
+
+void bench::finish(uint64_t cycle) {
+  std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - started;
+  std::cout << "finished on cycle " << cycle << " in " << elapsed.count() << " s" << std::endl;
+}
+
+bool glob_match(const char *pattern, const char *name) {
+  // Where to resume from if what followed the last "*" stops matching.
+  const char *star = nullptr, *resume = nullptr;
+  while (*name) {
+    if (*pattern == '*') {
+      star = pattern++;
+      resume = name;
+    } else if (*pattern == '?' || *pattern == *name) {
+      pattern++;
+      name++;
+    } else if (star) {
+      pattern = star + 1;
+      name = ++resume;
+    } else {
+      return false;
+    }
+  }
+  while (*pattern == '*')
+    pattern++;
+  return *pattern == '\0';
+}
+
+} // namespace niar
@@ -0,0 +1,105 @@
+// Testbench support niar compiles and links into every CXXRTL simulator.
+
+#ifndef NIAR_HARNESS_H
+#define NIAR_HARNESS_H
+
+#include <chrono>
+#include <cstdint>
+#include <fstream>
+#include <limits>
+#include <optional>
+#include <string>
+#include <vector>
+
+#include <cxxrtl/cxxrtl.h>
+#include <cxxrtl/cxxrtl_vcd.h>
+
+namespace niar {
+
+// What to record, as given on the command line by `niar cxxrtl`.
+struct waveform_options {
+  std::optional<std::string> path;
+  // Globs matched against dotted hierarchical names, e.g. "top.blinker.*".
+  // Everything is recorded if there are none.
+  std::vector<std::string> signals;
+  // Inclusive, in the testbench's own time units (what it samples with).
+  uint64_t from = 0;
+  uint64_t to = std::numeric_limits<uint64_t>::max();
+
+  // If argv[i] is one of --vcd PATH, --vcd-signals GLOB[,GLOB...],
+  // --vcd-from TIME or --vcd-to TIME, consumes it and its value and returns
+  // true. Exits if its value is missing or malformed.
+  bool parse(int argc, char **argv, int &i);
+};
+
+// A VCD writer which streams to disk as it samples, rather than holding the
+// whole waveform in memory until exit, and records only the signals and
+// window of time asked for. Closing or destroying it writes out everything
+// sampled. Until then it writes every MiB and at least every second or so,
+// so a crash or abort(), e.g. a failed assert, which skips its destructor,
+// loses at most about the last second's samples.
+class waveform_writer {
+public:
+  ~waveform_writer() { close(); }
+
+  // Does nothing (and returns true) if no path was given. Returns false if
+  // the file couldn't be opened.
+  bool open(const waveform_options &options, const cxxrtl::debug_items &items);
+
+  void sample(uint64_t time) {
+    if (!out.is_open() || time < options.from)
+      return;
+    if (time > options.to) {
+      close();
+      return;
+    }
+    vcd.sample(time);
+    // Reading the clock every sample would cost more than sampling.
+    if (vcd.buffer.size() >= flush_threshold ||
+        (++samples % clock_every == 0 &&
+         std::chrono::steady_clock::now() - flushed >= flush_interval))
+      flush();
+  }
+
+  void flush();
+  void close();
+
+private:
+  static constexpr size_t flush_threshold = 1 << 20;
+  static constexpr uint64_t clock_every = 1024;
+  static constexpr std::chrono::seconds flush_interval{1};
+
+  waveform_options options;
+  uint64_t samples = 0;
+  std::chrono::steady_clock::time_point flushed;
+  cxxrtl::vcd_writer vcd;
+  std::ofstream out;
+};
+
+// How far to run, as given by `niar cxxrtl --bench-cycles`, and how long the
+// simulation itself took, so cycles/s leaves out start-up and teardown.
+class bench {
+public:
+  // The testbench should stop, successfully, once it's stepped this many
+  // cycles.
+  uint64_t cycles = std::numeric_limits<uint64_t>::max();
+
+  // If argv[i] is --cycles N, consumes it and its value and returns true.
+  // Exits if its value is missing or malformed.
+  bool parse(int argc, char **argv, int &i);
+
+  // Call once set up, before the first step to be timed.
+  void start() { started = std::chrono::steady_clock::now(); }
+  // Prints "finished on cycle N in S s", which niar reads back.
+  void finish(uint64_t cycle);
+
+private:
+  std::chrono::steady_clock::time_point started = std::chrono::steady_clock::now();
+};
+
+// "*" matches any run of characters, "?" any one.
+bool glob_match(const char *pattern, const char *name);
+
+} // namespace niar
+
+#endif
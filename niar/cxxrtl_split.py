@@ -0,0 +1,77 @@
+import re
+
+__all__ = ["split_cxxrtl"]
+
+
+_NAMESPACE_START = "namespace cxxrtl_design {\n"
+_NAMESPACE_END = "} // namespace cxxrtl_design\n"
+# An out-of-class member function definition, e.g. "bool p_top::eval(performer
+# *performer) {", possibly preceded by attributes on lines of their own.
+_DEFINITION = re.compile(r"^[^\s#].*\b\w+::~?\w+\(.*\)\s*(?:const\s*)?\{$", re.MULTILINE)
+# What every shard needs of what comes before the namespace. Everything else
+# (the C API implementations, when included) goes only in the first.
+_SHARED = re.compile(r'^(?:#include ".*"|using namespace \w+;)$')
+
+
+def split_cxxrtl(source: str, shards: int) -> list[str]:
+    """
+    Split C++ written by ``write_cxxrtl -header`` into ``shards`` translation
+    units which can be compiled in parallel, by distributing the module
+    member functions it defines between them, largest first. The first
+    shard keeps everything else.
+
+    Always returns ``shards`` sources, so the caller can name them ahead of
+    time; some may define nothing. If the source isn't laid out as
+    expected, it's returned whole as the first.
+    """
+    lines = source.splitlines(keepends=True)
+    items = _definitions(lines)
+    if items is None:
+        return [source] + [""] * (shards - 1)
+
+    start = lines.index(_NAMESPACE_START)
+    end = lines.index(_NAMESPACE_END)
+    prologue = lines[:start + 1]
+    epilogue = lines[end:]
+    shared = [line for line in prologue if _SHARED.match(line.rstrip("\n"))]
+
+    # Greedy, by line count: the best proxy we have for compile time.
+    assigned = [[] for _ in range(shards)]
+    sizes = [0] * shards
+    for index, item in sorted(enumerate(items), key=lambda e: len(e[1]), reverse=True):
+        shard = sizes.index(min(sizes))
+        assigned[shard].append(index)
+        sizes[shard] += len(item)
+
+    sources = []
+    for shard, indices in enumerate(assigned):
+        body = [line for index in sorted(indices) for line in ["\n", *items[index]]]
+        if shard == 0:
+            sources.append("".join(prologue + body + ["\n"] + epilogue))
+        else:
+            sources.append("".join(shared + ["\n", _NAMESPACE_START] + body + ["\n", _NAMESPACE_END]))
+    return sources
+
+
+def _definitions(lines):
+    if lines.count(_NAMESPACE_START) != 1 or lines.count(_NAMESPACE_END) != 1:
+        return None
+    start = lines.index(_NAMESPACE_START)
+    end = lines.index(_NAMESPACE_END)
+
+    items = []
+    item = []
+    for line in lines[start + 1:end]:
+        if not item and not line.strip():
+            continue
+        item.append(line)
+        if line == "}\n":
+            items.append(item)
+            item = []
+    if item:
+        return None
+    # Only member functions can be moved; anything else (e.g. a static
+    # helper) might be used from elsewhere in the file.
+    if not all(_DEFINITION.search("".join(item)) for item in items):
+        return None
+    return items
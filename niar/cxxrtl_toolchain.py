@@ -0,0 +1,148 @@
+import json
+import shlex
+import shutil
+import subprocess
+from functools import cached_property
+from typing import Optional
+
+from .logging import logger
+
+__all__ = ["CxxToolchain"]
+
+
+LAUNCHERS = ["ccache", "sccache"]
+# With the executable each is found as.
+LINKERS = {"mold": "mold", "lld": "ld.lld"}
+
+
+class CxxToolchain:
+    """
+    The C++ compiler CXXRTL simulators are built with, the compiler cache
+    (if any) it's launched through, and the linker (if not the default) it
+    links with.
+    """
+
+    def __init__(self, cxx: list[str], *, launcher: Optional[str] = None,
+                 linker: Optional[str] = None):
+        self.cxx = list(cxx)
+        self.launcher = launcher
+        self.linker = linker
+
+    @classmethod
+    def detect(cls, *, zig: bool = False, launcher: str = "auto", linker: str = "auto") -> "CxxToolchain":
+        """
+        ``launcher`` is one of :data:`LAUNCHERS`, ``"none"`` or ``"auto"``
+        for the first found; ``linker`` one of :data:`LINKERS`,
+        ``"default"`` or ``"auto"`` for the first the compiler can use.
+        """
+        if zig:
+            # Zig caches compiles itself, and always links with its own lld.
+            if launcher not in ("auto", "none") or linker not in ("auto", "default"):
+                raise RuntimeError("zig can't be used with a compiler cache or another linker")
+            return cls(["zig", "c++"])
+
+        cxx = ["c++"]
+        match launcher:
+            case "auto":
+                launcher = next((name for name in LAUNCHERS if shutil.which(name)), None)
+            case "none":
+                launcher = None
+            case _ if not shutil.which(launcher):
+                raise RuntimeError(f"compiler cache {launcher!r} not found")
+
+        match linker:
+            case "auto":
+                linker = next((name for name, exe in LINKERS.items()
+                               if shutil.which(exe) and _can_link_with(cxx, name)), None)
+            case "default":
+                linker = None
+            case _ if not _can_link_with(cxx, linker):
+                raise RuntimeError(f"{shlex.join(cxx)} can't link with {linker!r}")
+
+        return cls(cxx, launcher=launcher, linker=linker)
+
+    @cached_property
+    def is_clang(self) -> bool:
+        try:
+            version = subprocess.run([*self.cxx, "--version"], capture_output=True, text=True).stdout
+        except FileNotFoundError:
+            return False
+        return "clang" in version
+
+    def compile_launcher(self, *, pch: bool = False) -> list[str]:
+        """
+        What to prefix compile commands with, to be kept out of their digests
+        and ``compile_commands.json``.
+        """
+        if self.launcher is None:
+            return []
+        if self.launcher == "ccache" and pch:
+            # ccache won't cache compiles using a PCH otherwise.
+            return ["env", "CCACHE_SLOPPINESS=pch_defines,time_macros,include_file_mtime",
+                    "ccache"]
+        return [self.launcher]
+
+    def pch_flags(self, pch_h_path) -> list[str]:
+        """
+        Flags to include ``pch_h_path``, using its precompiled form if
+        it's usable; an unusable one is warned about and the header parsed
+        instead.
+        """
+        flags = ["-Winvalid-pch", "-include", pch_h_path]
+        if self.launcher == "ccache" and not self.is_clang:
+            flags.append("-fpch-preprocess")
+        return flags
+
+    def pch_suffix(self) -> str:
+        # Both find these when asked to "-include" the header.
+        return ".pch" if self.is_clang else ".gch"
+
+    def link_flags(self) -> list[str]:
+        return [f"-fuse-ld={self.linker}"] if self.linker else []
+
+    def cache_stats(self) -> Optional[dict[str, int]]:
+        """
+        The compiler cache's cumulative hit and miss counts, if it can tell
+        us; compare two to see what happened in between.
+        """
+        try:
+            match self.launcher:
+                case "ccache":
+                    output = subprocess.run(["ccache", "--print-stats"], capture_output=True,
+                                            text=True, check=True).stdout
+                    stats = dict(line.split("\t", 1) for line in output.splitlines() if "\t" in line)
+                    return {
+                        "hits": int(stats.get("direct_cache_hit", 0)) +
+                                int(stats.get("preprocessed_cache_hit", 0)),
+                        "misses": int(stats.get("cache_miss", 0)),
+                    }
+                case "sccache":
+                    output = subprocess.run(["sccache", "--show-stats", "--stats-format=json"],
+                                            capture_output=True, text=True, check=True).stdout
+                    stats = json.loads(output)["stats"]
+                    return {
+                        "hits": sum(stats["cache_hits"]["counts"].values()),
+                        "misses": sum(stats["cache_misses"]["counts"].values()),
+                    }
+        except (OSError, subprocess.CalledProcessError, ValueError, KeyError):
+            # e.g. ccache before 4.0, which has no --print-stats.
+            pass
+        return None
+
+    def log_cache_stats(self, before: Optional[dict[str, int]]):
+        after = self.cache_stats()
+        if before is None or after is None:
+            return
+        hits = after["hits"] - before["hits"]
+        misses = after["misses"] - before["misses"]
+        if hits + misses:
+            logger.info(f"{self.launcher}: {hits} hits, {misses} misses "
+                        f"({hits / (hits + misses):.0%} hit rate)")
+
+
+def _can_link_with(cxx, linker) -> bool:
+    try:
+        return subprocess.run([*cxx, f"-fuse-ld={linker}", "-Wl,--version"],
+                              capture_output=True).returncode == 0
+    except FileNotFoundError:
+        return False
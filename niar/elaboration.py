@@ -0,0 +1,238 @@
+import hashlib
+import importlib.metadata
+import inspect
+import json
+import os
+import sys
+import sysconfig
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from .logging import logger
+from .project import Project
+
+__all__ = ["ElaborationCache", "elaboration_digest"]
+
+
+def elaboration_digest(np: Project, platform, **options) -> str:
+    """
+    Fingerprint everything elaboration depends on: the project's Python
+    sources, the platform's class hierarchy, externals, the Amaranth and niar
+    versions, ``AMARANTH_*`` environment variables and ``options``.
+    """
+    m = hashlib.sha256()
+
+    def add(*parts):
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            m.update(len(part).to_bytes(8, "little"))
+            m.update(part)
+
+    for package in ["amaranth", "niar"]:
+        try:
+            add(package, importlib.metadata.version(package))
+        except importlib.metadata.PackageNotFoundError:
+            add(package, "?")
+    add(json.dumps(options, sort_keys=True, default=repr))
+    add(json.dumps(sorted((k, v) for k, v in os.environ.items() if k.startswith("AMARANTH_"))))
+
+    for path in sorted(_source_files(np, platform)):
+        add(str(path))
+        with open(path, "rb") as f:
+            add(hashlib.file_digest(f, "sha256").digest())
+    for external in np.externals:
+        add(external)
+        with open(np.path(external), "rb") as f:
+            add(hashlib.file_digest(f, "sha256").digest())
+
+    return m.hexdigest()
+
+
+def _source_files(np: Project, platform) -> set[Path]:
+    files = set()
+
+    # Everything in the project's package, whether imported yet or not.
+    package = Path(sys.modules[type(np).__module__].__file__).parent
+    files.update(package.rglob("*.py"))
+
+    # Anything else of the project's which has been imported, and wherever
+    # the top and the platform are defined.
+    build = np.path.build()
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path is None:
+            continue
+        path = Path(path)
+        if path.is_relative_to(np.origin) and not path.is_relative_to(build):
+            files.add(path)
+    for cls in [np.top, *type(platform).__mro__]:
+        try:
+            files.add(Path(inspect.getfile(cls)))
+        except TypeError:
+            pass  # builtin
+
+    return {path.absolute() for path in files if path.suffix == ".py"}
+
+
+class ElaborationCache:
+    """
+    Remembers which files elaboration wrote to a build directory, the digest
+    they were elaborated from, and what elaboration turned out to depend on
+    beyond that (see :meth:`recording`), so a later run with the same digest
+    and dependencies can use them as they are.
+    """
+
+    def __init__(self, directory, digest: str):
+        self.path = Path(directory) / ".niar-elaboration.json"
+        self.digest = digest
+        # Path -> [size, mtime_ns, sha256], and distribution -> version.
+        self.dependencies = {}
+        self.distributions = {}
+
+    @contextmanager
+    def recording(self, *, exclude=None):
+        """
+        Record what elaboration in this block depends on: every non-stdlib
+        module imported by the end of it (wherever it's from), the version of
+        each distribution they belong to, and any other file opened for
+        reading (e.g. a ROM image), except those under ``exclude``.
+        """
+        global _opened
+        _install_audit_hook()
+        opened, _opened = _opened, set()
+        try:
+            yield
+            paths = {Path(path) for path in _opened}
+        finally:
+            _opened = opened
+
+        modules = {name: module for name, module in list(sys.modules.items())
+                   if name.partition(".")[0] not in sys.stdlib_module_names}
+        paths.update(Path(module.__file__) for module in modules.values()
+                     if getattr(module, "__file__", None))
+        exclude = Path(exclude).absolute() if exclude is not None else None
+        self.dependencies = {}
+        for path in sorted(paths):
+            path = path.absolute()
+            if ((exclude is not None and path.is_relative_to(exclude)) or
+                    "__pycache__" in path.parts or _is_stdlib(path) or not path.is_file()):
+                continue
+            self.dependencies[str(path)] = _fingerprint(path)
+
+        top_levels = {name.partition(".")[0] for name in modules}
+        self.distributions = {}
+        for name, dists in importlib.metadata.packages_distributions().items():
+            if name in top_levels:
+                for dist in dists:
+                    self.distributions[dist] = _version(dist)
+
+    def load(self) -> Optional[list[str]]:
+        """
+        The names of the files from the last elaboration, if it had the same
+        digest and they haven't been touched since.
+        """
+        try:
+            with open(self.path, "r") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if manifest.get("digest") != self.digest:
+            return None
+        for dist, version in manifest.get("distributions", {}).items():
+            if _version(dist) != version:
+                logger.debug(f"{dist} {version} is no longer what's installed")
+                return None
+        for path, fingerprint in manifest.get("dependencies", {}).items():
+            if not _unchanged(Path(path), fingerprint):
+                logger.debug(f"{path!r} changed since elaboration")
+                return None
+
+        for fn, (size, mtime_ns) in manifest["files"].items():
+            try:
+                st = os.stat(self.path.parent / fn)
+            except FileNotFoundError:
+                return None
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                logger.debug(f"{fn!r} changed since elaboration")
+                return None
+        # So saving again (with the same files) keeps them.
+        self.dependencies = manifest.get("dependencies", {})
+        self.distributions = manifest.get("distributions", {})
+        return list(manifest["files"])
+
+    def save(self, filenames):
+        files = {}
+        for fn in filenames:
+            st = os.stat(self.path.parent / fn)
+            files[fn] = [st.st_size, st.st_mtime_ns]
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "digest": self.digest,
+                "files": files,
+                "dependencies": self.dependencies,
+                "distributions": self.distributions,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+
+# Paths opened for reading while recording, or None. Audit hooks can't be
+# removed, so ours is installed once and does nothing the rest of the time.
+_opened: Optional[set[str]] = None
+_audit_hook_installed = False
+
+
+def _install_audit_hook():
+    global _audit_hook_installed
+    if not _audit_hook_installed:
+        sys.addaudithook(_audit)
+        _audit_hook_installed = True
+
+
+def _audit(event, args):
+    if _opened is None or event != "open":
+        return
+    path, mode, flags = args
+    if isinstance(path, int):
+        return
+    if mode is not None:
+        reading = not set(mode) & set("wax+")
+    else:
+        reading = flags & os.O_ACCMODE == os.O_RDONLY
+    if reading:
+        _opened.add(os.fsdecode(os.fspath(path)))
+
+
+def _is_stdlib(path: Path) -> bool:
+    paths = sysconfig.get_paths()
+    if any(path.is_relative_to(paths[key]) for key in ["purelib", "platlib"]):
+        return False
+    return any(path.is_relative_to(paths[key]) for key in ["stdlib", "platstdlib"])
+
+
+def _version(dist: str) -> str:
+    try:
+        return importlib.metadata.version(dist)
+    except importlib.metadata.PackageNotFoundError:
+        return "?"
+
+
+def _fingerprint(path: Path) -> list:
+    st = path.stat()
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return [st.st_size, st.st_mtime_ns, digest]
+
+
+def _unchanged(path: Path, fingerprint) -> bool:
+    size, mtime_ns, digest = fingerprint
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return False
+    if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+        return True
+    # Touched, but maybe not changed.
+    return st.st_size == size and _fingerprint(path)[2] == digest
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+__all__ = ["can_stream", "convert_to_file", "streaming_prepare", "streaming_supported", "write_rtlil"]
+
+
+# Streaming drives Amaranth's RTLIL backend through its internals, which
+# change between releases, so only the releases it's been checked against
+# (byte for byte, by tests/test_emit.py) stream. Others convert as usual.
+TESTED_AMARANTH = ((0, 5), (0, 6))
+
+
+def streaming_supported() -> bool:
+    """
+    Whether the installed Amaranth is one :func:`write_rtlil` can stream
+    with.
+    """
+    from amaranth import __version__
+
+    m = re.match(r"(\d+)\.(\d+)", __version__)
+    if m is None:
+        return False
+    return TESTED_AMARANTH[0] <= (int(m[1]), int(m[2])) < TESTED_AMARANTH[1]
+
+
+def write_rtlil(fragment, path, ports=(), name="top", *, emit_src=True, header="", **kwargs):
+    """
+    As ``amaranth.back.rtlil.convert_fragment``, but writing the RTLIL to
+    ``path`` one module at a time instead of returning it, so only one
+    module's text is held at once, after ``header``. The file is left
+    untouched if the result is the same as what's there. Returns the name
+    map.
+
+    With an Amaranth release outside :data:`TESTED_AMARANTH`, the RTLIL is
+    converted whole with ``convert_fragment`` and written out.
+    """
+    from amaranth.back import rtlil
+
+    if not streaming_supported():
+        from .cmdrunner import write_if_changed
+
+        rtlil_text, name_map = rtlil.convert_fragment(fragment, ports, name, emit_src=emit_src,
+                                                      **kwargs)
+        write_if_changed(path, header + rtlil_text)
+        return name_map
+
+    from amaranth.hdl import _ast, _ir
+
+    path = Path(path)
+    name_map = _ast.SignalDict()
+    netlist = _ir.build_netlist(fragment, ports=ports, name=name, **kwargs)
+    empty_checker = rtlil.EmptyModuleChecker(netlist)
+
+    m = hashlib.sha256()
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        m.update(header.encode())
+        f.write(header)
+        for module_idx, module in enumerate(netlist.modules):
+            if empty_checker.is_empty(module_idx):
+                continue
+            builder = rtlil.Design(emit_src=emit_src)
+            module_builder = builder.module(".".join(module.name), src_loc=module.src_loc)
+            if module_idx == 0:
+                module_builder.attribute("top", 1)
+            rtlil.ModuleEmitter(module_builder, netlist, module, name_map,
+                                empty_checker=empty_checker).emit()
+            text = str(builder)
+            m.update(text.encode())
+            f.write(text)
+
+    if _file_digest(path) == m.digest():
+        os.unlink(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return name_map
+
+
+def convert_to_file(elaboratable, path, name="top", platform=None, *, ports=None, emit_src=True,
+                    **kwargs):
+    """
+    As ``amaranth.back.rtlil.convert``, but writing to ``path``; see
+    :func:`write_rtlil`.
+    """
+    if not streaming_supported():
+        from amaranth.back import rtlil
+
+        from .cmdrunner import write_if_changed
+
+        write_if_changed(path, rtlil.convert(elaboratable, name, platform, ports=ports,
+                                             emit_src=emit_src, **kwargs))
+        return
+
+    from amaranth.hdl import _ast, _ir
+    from amaranth.lib import wiring
+
+    if (ports is None and
+            hasattr(elaboratable, "signature") and
+            isinstance(elaboratable.signature, wiring.Signature)):
+        ports = {}
+        for path_, member, value in elaboratable.signature.flatten(elaboratable):
+            if isinstance(value, _ast.ValueCastable):
+                value = value.as_value()
+            if isinstance(value, _ast.Value):
+                if member.flow == wiring.In:
+                    dir = _ir.PortDirection.Input
+                else:
+                    dir = _ir.PortDirection.Output
+                ports["__".join(map(str, path_))] = (value, dir)
+    elif ports is None:
+        raise TypeError("The `convert_to_file()` function requires a `ports=` argument")
+    fragment = _ir.Fragment.get(elaboratable, platform)
+    write_rtlil(fragment, path, ports, name, emit_src=emit_src, **kwargs)
+
+
+@contextmanager
+def streaming_prepare(platform, path):
+    """
+    Make ``platform.prepare`` write the design's RTLIL file to ``path`` as
+    it's generated, instead of into the plan. The plan's copy is left
+    without the RTLIL.
+
+    Only sound for platforms whose templates read the RTLIL file and don't
+    otherwise render the design (e.g. as Verilog); see :func:`can_stream`.
+    """
+    from amaranth import __version__
+    from amaranth.back import rtlil
+
+    convert_fragment = rtlil.convert_fragment
+    # What the template renders before the RTLIL, as Amaranth would.
+    header = f"# Automatically generated by Amaranth {__version__}. Do not edit.\n"
+
+    def streaming_convert_fragment(fragment, ports=(), name="top", *, emit_src=True, **kwargs):
+        return "", write_rtlil(fragment, path, ports, name, emit_src=emit_src, header=header,
+                               **kwargs)
+
+    rtlil.convert_fragment = streaming_convert_fragment
+    try:
+        yield
+    finally:
+        rtlil.convert_fragment = convert_fragment
+
+
+# The RTLIL file as every platform Amaranth ships renders it.
+_RTLIL_TEMPLATE = "# {{autogenerated}}\n{{emit_rtlil()}}"
+
+
+def can_stream(platform, *, debug_verilog: bool) -> bool:
+    """
+    Whether the RTLIL file is the only thing ``platform`` renders from the
+    design, and the installed Amaranth can be streamed with, so
+    :func:`streaming_prepare` can be used.
+    """
+    if not streaming_supported():
+        return False
+    import textwrap
+
+    templates = getattr(platform, "file_templates", None)
+    if not isinstance(templates, dict) or "{{name}}.il" not in templates:
+        return False
+    if textwrap.dedent(templates["{{name}}.il"]).strip() != _RTLIL_TEMPLATE:
+        return False
+    uses = ["emit_rtlil", "emit_verilog"] + (["emit_debug_verilog"] if debug_verilog else [])
+    return not any(use + "(" in template
+                   for fn, template in templates.items() if fn != "{{name}}.il"
+                   for use in uses)
+
+
+def _file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").digest()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,182 @@
+import json
+import logging
+import math
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime
+from functools import partial
+from typing import Optional
+
+from .logging import logger
+from .project import Project
+from .report import BuildReport
+
+__all__ = ["History", "add_arguments"]
+
+
+class Build:
+    def __init__(self, row):
+        (self.id, timestamp, self.revision, self.dirty, self.board, self.design_digest,
+         report, durations) = row
+        self.timestamp = datetime.fromisoformat(timestamp)
+        self.report = BuildReport.load_dict(json.loads(report))
+        self.durations = json.loads(durations)
+
+    @property
+    def label(self):
+        revision = (self.revision or "?")[:10] + ("+" if self.dirty else "")
+        return f"#{self.id} {revision} {self.timestamp:%Y-%m-%d %H:%M}"
+
+    def metrics(self) -> dict[str, tuple[float, bool]]:
+        """
+        Each metric's value, and whether a bigger value is better.
+        """
+        metrics = {}
+        for resource, utilisation in self.report.utilisation.items():
+            metrics[resource] = (utilisation.used, False)
+        for clock, timing in self.report.fmax.items():
+            metrics[f"fmax {clock} (MHz)"] = (timing.achieved_mhz, True)
+        for phase, seconds in self.durations.items():
+            metrics[f"{phase} (s)"] = (seconds, False)
+        return metrics
+
+
+class History:
+    """
+    Every build's metrics, kept in ``build/history.sqlite`` so they survive
+    the board's build directory being rebuilt.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS builds (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                revision TEXT,
+                dirty INTEGER NOT NULL,
+                board TEXT NOT NULL,
+                design_digest TEXT NOT NULL,
+                report TEXT NOT NULL,
+                durations TEXT NOT NULL
+            )
+        """)
+
+    def record(self, np: Project, *, board: str, design_digest: str, report: BuildReport,
+               durations: dict[str, float]):
+        revision, dirty = git_revision(np)
+        with self.db:
+            self.db.execute(
+                "INSERT INTO builds (timestamp, revision, dirty, board, design_digest, report, durations) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec="seconds"), revision, dirty, board, design_digest,
+                 json.dumps(report.to_dict()), json.dumps(durations)))
+
+    def builds(self, board: str, *, limit: int) -> list[Build]:
+        rows = self.db.execute(
+            "SELECT * FROM builds WHERE board = ? ORDER BY id DESC LIMIT ?", (board, limit))
+        return [Build(row) for row in rows]
+
+    def latest(self, board: str, *, revision: Optional[str] = None) -> Optional[Build]:
+        if revision is None:
+            row = self.db.execute(
+                "SELECT * FROM builds WHERE board = ? ORDER BY id DESC LIMIT 1", (board,)).fetchone()
+        else:
+            row = self.db.execute(
+                "SELECT * FROM builds WHERE board = ? AND revision = ? AND NOT dirty "
+                "ORDER BY id DESC LIMIT 1", (board, revision)).fetchone()
+        return row and Build(row)
+
+
+def git_revision(np: Project, rev: str = "HEAD") -> tuple[Optional[str], bool]:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--verify", f"{rev}^{{commit}}"],
+            cwd=np.path(), capture_output=True, text=True, check=True).stdout.strip()
+        dirty = rev == "HEAD" and bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=np.path(), capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return revision, dirty
+
+
+def add_arguments(np: Project, parser):
+    parser.set_defaults(func=partial(main, np))
+    match sorted(t.__name__ for t in np.targets):
+        case []:
+            raise RuntimeError("no buildable targets defined")
+        case [first, *rest]:
+            parser.add_argument(
+                "-b",
+                "--board",
+                choices=[first, *rest],
+                help="which board's builds to show",
+                required=bool(rest),
+                **({"default": first} if not rest else {}),
+            )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=10,
+        help="how many recent builds to list (default: 10)",
+    )
+    parser.add_argument(
+        "-c",
+        "--compare",
+        metavar="REV",
+        help="compare the latest build against the latest clean build of this revision",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=5.0,
+        help="percentage change in utilisation or fmax to flag as a regression (default: 5)",
+    )
+
+
+def main(np: Project, args):
+    history = History(np.path.build("history.sqlite"))
+
+    if args.compare is None:
+        for build in reversed(history.builds(args.board, limit=args.limit)):
+            metrics = ", ".join(
+                f"{name}: {value:g}" for name, (value, _) in build.metrics().items()
+                if not name.endswith("(s)"))
+            logger.info(f"{build.label}: {metrics}")
+        return
+
+    revision, _ = git_revision(np, args.compare)
+    baseline = history.latest(args.board, revision=revision or args.compare)
+    current = history.latest(args.board)
+    if baseline is None:
+        logger.error(f"no clean build of {args.compare!r} for {args.board} in history")
+        sys.exit(2)
+
+    logger.info(f"baseline {baseline.label}")
+    logger.info(f"current  {current.label}")
+    regressed = False
+    baseline_metrics = baseline.metrics()
+    for name, (value, higher_is_better) in current.metrics().items():
+        if name not in baseline_metrics:
+            logger.info(f"  {name:<32} {'':>10} -> {value:>10g}")
+            continue
+        base = baseline_metrics[name][0]
+        if base:
+            change = (value - base) / base * 100
+        else:
+            # From nothing (e.g. no failing paths) any change is unbounded.
+            change = math.copysign(math.inf, value) if value else 0.0
+        worse = -change if higher_is_better else change
+        # Durations are too noisy to gate on.
+        flag = worse > args.threshold and not name.endswith("(s)")
+        regressed |= flag
+        logger.log(logging.WARNING if flag else logging.INFO,
+                   f"  {name:<32} {base:>10g} -> {value:>10g} ({change:+.1f}%)"
+                   f"{'  REGRESSION' if flag else ''}")
+
+    if regressed:
+        sys.exit(1)
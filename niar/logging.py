@@ -1,8 +1,10 @@
 import logging
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 
+from . import trace
+
 __all__ = ["logger", "logtime"]
 
 logging.basicConfig(
@@ -13,17 +15,30 @@ logging.basicConfig(
 logger = logging.getLogger("niar")
 
 
+class Span:
+    start: datetime
+    finish: Optional[datetime] = None
+
+    def __init__(self):
+        self.start = datetime.now()
+
+    @property
+    def elapsed(self) -> timedelta:
+        return (self.finish or datetime.now()) - self.start
+
+
 @contextmanager
 def logtime(level: int, activity: str, /, fail_level: Optional[int] = None):
     global logger
-    start = datetime.now()
+    span = Span()
     logger.log(level, "starting %s", activity)
     try:
-        yield
+        with trace.span(activity):
+            yield span
     except:
-        finish = datetime.now()
-        logger.log(fail_level or level, "%s failed in %s", activity, finish - start)
+        span.finish = datetime.now()
+        logger.log(fail_level or level, "%s failed in %s", activity, span.elapsed)
         raise
     else:
-        finish = datetime.now()
-        logger.log(level, "%s finished in %s", activity, finish - start)
+        span.finish = datetime.now()
+        logger.log(level, "%s finished in %s", activity, span.elapsed)
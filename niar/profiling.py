@@ -0,0 +1,140 @@
+import cProfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from .logging import logger
+
+__all__ = ["ElaborationProfile"]
+
+
+@dataclass
+class Elaboration:
+    path: tuple[str, ...]
+    cls: str
+    # Both exclude the elaboration of submodules.
+    seconds: float
+    allocated: int
+
+
+class ElaborationProfile:
+    """
+    Time and memory spent elaborating each elaboratable in the design,
+    attributed by module path, plus a cProfile of the whole of elaboration
+    (including conversion to RTLIL, which isn't attributed to modules).
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.elaborations: list[Elaboration] = []
+        self.total_seconds = 0.0
+        self.peak_allocated = 0
+
+    @contextmanager
+    def __call__(self, name: str):
+        from amaranth.hdl import Fragment
+
+        get = Fragment.get
+        stack = []
+        calls = []
+        tops = []
+
+        def profiled_get(obj, platform):
+            entry = {"obj": obj, "children_ns": 0, "children_allocated": 0}
+            stack.append(entry)
+            start_ns = time.perf_counter_ns()
+            start_allocated = tracemalloc.get_traced_memory()[0]
+            try:
+                fragment = get(obj, platform)
+            finally:
+                stack.pop()
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            allocated = tracemalloc.get_traced_memory()[0] - start_allocated
+            if stack:
+                stack[-1]["children_ns"] += elapsed_ns
+                stack[-1]["children_allocated"] += allocated
+            calls.append((obj, fragment, elapsed_ns - entry["children_ns"],
+                          allocated - entry["children_allocated"]))
+            if not stack:
+                # Anything elaborated on its own after the design (e.g. pin
+                # buffers, by prepare) is added to it later under a name we
+                # can't see; label it by class.
+                root = (name,) if not tops else (name, f"<{type(obj).__qualname__}>")
+                tops.append(fragment)
+                self._attribute(root, fragment, calls)
+                calls.clear()
+            return fragment
+
+        tracemalloc.start()
+        Fragment.get = staticmethod(profiled_get)
+        start = time.perf_counter()
+        self.profiler.enable()
+        try:
+            yield self
+        finally:
+            self.profiler.disable()
+            self.total_seconds += time.perf_counter() - start
+            Fragment.get = staticmethod(get)
+            self.peak_allocated = max(self.peak_allocated, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    def _attribute(self, root, top, calls):
+        paths = {}
+
+        def walk(fragment, path):
+            paths[id(fragment)] = path
+            for origin in getattr(fragment, "origins", None) or ():
+                paths[id(origin)] = path
+            for index, (subfragment, subname, _src_loc) in enumerate(fragment.subfragments):
+                walk(subfragment, (*path, subname or f"U${index}"))
+
+        walk(top, root)
+        for obj, fragment, elapsed_ns, allocated in calls:
+            path = paths.get(id(obj), paths.get(id(fragment), (*root, "?")))
+            self.elaborations.append(Elaboration(
+                path=path,
+                cls=type(obj).__qualname__,
+                seconds=elapsed_ns / 1e9,
+                allocated=allocated,
+            ))
+
+    def log(self, *, limit: int = 20):
+        elaborated = sum(e.seconds for e in self.elaborations)
+        logger.info(f"Elaboration took {self.total_seconds:.2f}s, "
+                    f"{elaborated:.2f}s of it in elaborate(); "
+                    f"peak traced memory {self.peak_allocated / 2**20:,.1f} MiB")
+        logger.info(f"  {'seconds':>8} {'MiB':>8}  module")
+        # An elaboratable may be elaborated more than once, e.g. when
+        # @cache_rtlil converts it separately.
+        merged = {}
+        for e in self.elaborations:
+            if (e.path, e.cls) in merged:
+                merged[e.path, e.cls].seconds += e.seconds
+                merged[e.path, e.cls].allocated += e.allocated
+            else:
+                merged[e.path, e.cls] = Elaboration(e.path, e.cls, e.seconds, e.allocated)
+        ranked = sorted(merged.values(), key=lambda e: e.seconds, reverse=True)
+        for e in ranked[:limit]:
+            logger.info(f"  {e.seconds:>8.3f} {e.allocated / 2**20:>8.2f}  "
+                        f"{'.'.join(e.path)} ({e.cls})")
+        if len(ranked) > limit:
+            logger.info(f"  ... and {len(ranked) - limit} more")
+
+    def save(self, stem: Path):
+        """
+        Write ``<stem>.pstats`` for e.g. snakeviz, and ``<stem>.folded``: time
+        per module path in the folded stack format taken by flamegraph.pl,
+        inferno and speedscope.
+        """
+        self.profiler.dump_stats(f"{stem}.pstats")
+        folded = {}
+        for e in self.elaborations:
+            key = ";".join(e.path)
+            folded[key] = folded.get(key, 0) + round(e.seconds * 1e6)
+        with open(f"{stem}.folded", "w") as f:
+            for key, micros in folded.items():
+                f.write(f"{key} {micros}\n")
+        logger.info(f"Elaboration profile written to {stem}.pstats and {stem}.folded")
+
@@ -1,17 +1,29 @@
+import importlib
 import os
 import sys
 from pathlib import Path
-from typing import Optional
-
-from amaranth import Elaboratable
-from amaranth.build import Platform
+from typing import TYPE_CHECKING, Optional, Union
 
 from .command import Command
 from .cxxrtl_platform import CxxrtlPlatform
 
+if TYPE_CHECKING:
+    from amaranth import Elaboratable
+    from amaranth.build import Platform
+
 __all__ = ["Project"]
 
 
+def _resolve(ty: Union[type, str]) -> type:
+    # Types may be given as "module:Name", so that they're only imported when
+    # a project is validated. Any project that passes validation has already
+    # imported them anyway.
+    if isinstance(ty, str):
+        module, name = ty.split(":")
+        return getattr(importlib.import_module(module), name)
+    return ty
+
+
 class Prop:
     def __init__(
         self,
@@ -19,25 +31,33 @@ class Prop:
         *,
         description: str,
         required: bool,
-        isinstance: Optional[type] = None,
-        isinstance_list: Optional[type] = None,
-        issubclass: Optional[type] = None,
-        issubclass_list: Optional[type] = None,
+        isinstance: Optional[Union[type, str]] = None,
+        isinstance_list: Optional[Union[type, str]] = None,
+        issubclass: Optional[Union[type, str]] = None,
+        issubclass_list: Optional[Union[type, str]] = None,
     ):
         self.name = name
         self.description = description
         self.required = required
-        self.isinstance = isinstance
-        self.isinstance_list = isinstance_list
-        self.issubclass = issubclass
-        self.issubclass_list = issubclass_list
+        self._isinstance = isinstance
+        self._isinstance_list = isinstance_list
+        self._issubclass = issubclass
+        self._issubclass_list = issubclass_list
+
+    isinstance = property(lambda self: self._isinstance and _resolve(self._isinstance))
+    isinstance_list = property(lambda self: self._isinstance_list and _resolve(self._isinstance_list))
+    issubclass = property(lambda self: self._issubclass and _resolve(self._issubclass))
+    issubclass_list = property(lambda self: self._issubclass_list and _resolve(self._issubclass_list))
 
     def validate(self, project):
+        # Only the unresolved types, and only resolved where there's an
+        # element to check, so that e.g. "targets = []" doesn't import
+        # amaranth.build.
         assert len(list(filter(None, [
-            self.isinstance,
-            self.isinstance_list,
-            self.issubclass,
-            self.issubclass_list,
+            self._isinstance,
+            self._isinstance_list,
+            self._issubclass,
+            self._issubclass_list,
         ]))) == 1, "must define exactly one of the is... parameters"
 
         if self.required:
@@ -49,27 +69,27 @@ class Prop:
             return
 
         attr = getattr(project, self.name)
-        if self.isinstance:
+        if self._isinstance:
             assert isinstance(attr, self.isinstance), (
                 f"{project.__module__}.{project.__class__.__qualname__} property "
                 f"{self.name!r} ({self.description}) should an instance of "
                 f"{self.isinstance!r}, but is {attr!r}"
             )
-        if self.isinstance_list:
+        if self._isinstance_list:
             assert isinstance(attr, list)
             for elem in attr:
                 assert isinstance(elem, self.isinstance_list), (
                     f"{project.__module__}.{project.__class__.__qualname__} property "
                     f"{self.name!r} ({self.description}) should a list of instances of "
-                    f"{self.isinstanc_list!r}, but has element {elem!r}"
+                    f"{self.isinstance_list!r}, but has element {elem!r}"
                 )
-        if self.issubclass:
+        if self._issubclass:
             assert issubclass(attr, self.issubclass), (
                 f"{project.__module__}.{project.__class__.__qualname__} property "
                 f"{self.name!r} ({self.description}) should be a subclass of "
                 f"{self.issubclass!r}, but is {attr!r}"
             )
-        if self.issubclass_list:
+        if self._issubclass_list:
             assert isinstance(attr, list)
             for elem in attr:
                 assert issubclass(elem, self.issubclass_list), (
@@ -79,15 +99,43 @@ class Prop:
                 )
 
 
+class Origin:
+    """
+    The project root: the nearest directory containing ``pyproject.toml``
+    above the module defining the project, or ``NIAR_WORKING_DIRECTORY``.
+    Found on first use rather than at import.
+    """
+
+    def __get__(self, np, cls):
+        if "origin" not in cls.__dict__:
+            cls.origin = self.find(cls)
+        return cls.__dict__["origin"]
+
+    @staticmethod
+    def find(cls) -> Path:
+        if origin := os.getenv("NIAR_WORKING_DIRECTORY"):
+            return Path(origin).absolute()
+
+        # We expect to be defined in project-root/module/__init.py__ or similar;
+        # the origin is project-root. Keep going up until we find pyproject.toml.
+        origin = Path(sys.modules[cls.__module__].__file__).absolute().parent
+        while True:
+            if (origin / "pyproject.toml").is_file():
+                return origin
+            if not any(origin.parents):
+                assert False, "could not find pyproject.toml"
+            origin = origin.parent
+
+
 class Project:
     name: str
-    top: type[Elaboratable]
-    targets: list[type[Platform]]
+    top: "type[Elaboratable]"
+    targets: "list[type[Platform]]"
     cxxrtl_targets: list[type[CxxrtlPlatform]] = []
     externals: list[str] = []
     commands: list[Command] = []
 
-    origin: Path
+    origin: Path = Origin()
 
     PROPS = [
         Prop(
@@ -100,13 +148,13 @@ class Project:
             "top",
             description="a reference to the default top-level elaboratable to be built",
             required=True,
-            issubclass=Elaboratable,
+            issubclass="amaranth:Elaboratable",
         ),
         Prop(
             "targets",
             description="a list of platform classes the elaboratable is targetted for",
             required=True,
-            issubclass_list=Platform,
+            issubclass_list="amaranth.build:Platform",
         ),
         Prop(
             "cxxrtl_targets",
@@ -129,29 +177,16 @@ class Project:
     ]
 
     def __init_subclass__(cls):
-        if origin := os.getenv("NIAR_WORKING_DIRECTORY"):
-            cls.origin = Path(origin).absolute()
-        else:
-            # We expect to be called from project-root/module/__init.py__ or similar;
-            # cls.origin is project-root. Keep going up until we find pyproject.toml.
-            origin = Path(sys._getframe(1).f_code.co_filename).absolute().parent
-            while True:
-                if (origin / "pyproject.toml").is_file():
-                    cls.origin = origin
-                    break
-                if not any(origin.parents):
-                    assert False, "could not find pyproject.toml"
-                origin = origin.parent
-
-        os.chdir(cls.origin)
-
         extras = cls.__dict__.keys() - {"__module__", "__doc__", "origin"}
         for prop in cls.PROPS:
             prop.validate(cls)
             extras -= {prop.name}
         assert extras == set(), f"unknown project properties: {extras}"
 
-    def target_by_name(self, name: str) -> Platform:
+    def __init__(self):
+        os.chdir(self.origin)
+
+    def target_by_name(self, name: str) -> "Platform":
         for t in self.targets:
             if t.__name__ == name:
                 return t()
@@ -0,0 +1,212 @@
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+__all__ = ["BuildReport", "ClockTiming", "SlackBin", "Utilisation", "estimate_utilisation"]
+
+
+@dataclass
+class Utilisation:
+    used: int
+    available: int
+
+    @property
+    def fraction(self) -> float:
+        return self.used / self.available if self.available else 0.0
+
+
+@dataclass
+class ClockTiming:
+    achieved_mhz: float
+    target_mhz: float
+    passed: bool
+
+    @property
+    def headroom(self) -> float:
+        return self.achieved_mhz / self.target_mhz if self.target_mhz else float("inf")
+
+
+@dataclass
+class SlackBin:
+    # Slack in ps, [lower, upper).
+    lower: int
+    upper: int
+    # nextpnr draws the histogram in units of some number of endpoints; this
+    # is a lower bound.
+    endpoints: int
+
+
+@dataclass
+class BuildReport:
+    """
+    What we can gather from a build's Yosys and nextpnr logs: cell counts
+    per module, device utilisation per resource, achieved frequency per
+    clock and the slack histogram.
+    """
+
+    cells: dict[str, dict[str, int]] = field(default_factory=dict)
+    utilisation: dict[str, Utilisation] = field(default_factory=dict)
+    fmax: dict[str, ClockTiming] = field(default_factory=dict)
+    slack_histogram: list[SlackBin] = field(default_factory=list)
+
+    @classmethod
+    def from_logs(cls, *, yosys: Optional[str] = None, nextpnr: Optional[str] = None) -> "BuildReport":
+        report = cls()
+        if yosys is not None:
+            with open(yosys, "r") as f:
+                report.cells = _parse_yosys_stats(f)
+        if nextpnr is not None:
+            with open(nextpnr, "r") as f:
+                report.utilisation, report.fmax, report.slack_histogram = _parse_nextpnr_log(f)
+        return report
+
+    @classmethod
+    def load(cls, path) -> "BuildReport":
+        with open(path, "r") as f:
+            return cls.load_dict(json.load(f))
+
+    @classmethod
+    def load_dict(cls, data) -> "BuildReport":
+        return cls(
+            cells=data["cells"],
+            utilisation={k: Utilisation(**v) for k, v in data["utilisation"].items()},
+            fmax={k: ClockTiming(**v) for k, v in data["fmax"].items()},
+            slack_histogram=[SlackBin(**b) for b in data["slack_histogram"]],
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+    def estimated_utilisation(self) -> dict[str, int]:
+        """
+        The device resources nextpnr is likely to report as used, estimated
+        from the synthesised cell counts alone; see :func:`estimate_utilisation`.
+        """
+        cells = {}
+        for module_cells in self.cells.values():
+            for cell, count in module_cells.items():
+                cells[cell] = cells.get(cell, 0) + count
+        return estimate_utilisation(cells)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+# nextpnr resources which correspond one-to-one with a synthesised cell.
+_RESOURCE_CELLS = {
+    "ICESTORM_RAM": ["SB_RAM40_4K"],
+    "SB_IO": ["SB_IO"],
+    "ICESTORM_DSP": ["SB_MAC16"],
+    "ICESTORM_SPRAM": ["SB_SPRAM256KA"],
+    "TRELLIS_FF": ["TRELLIS_FF"],
+    "TRELLIS_IO": ["TRELLIS_IO"],
+    "DP16KD": ["DP16KD"],
+    "MULT18X18D": ["MULT18X18D"],
+}
+
+
+def estimate_utilisation(cells: dict[str, int]) -> dict[str, int]:
+    """
+    Estimate the resources nextpnr will report as used from synthesised cell
+    counts, for the iCE40 and ECP5 families. Packing can only be guessed at:
+    an ICESTORM_LC holds a LUT and a flip-flop, so we count whichever there
+    are more of, and a CCU2C occupies two TRELLIS_COMB slices.
+    """
+    estimate = {}
+    luts = cells.get("SB_LUT4", 0)
+    dffs = sum(count for cell, count in cells.items() if cell.startswith("SB_DFF"))
+    if luts or dffs:
+        estimate["ICESTORM_LC"] = max(luts, dffs)
+    comb = cells.get("LUT4", 0) + 2 * cells.get("CCU2C", 0)
+    if comb:
+        estimate["TRELLIS_COMB"] = comb
+    for resource, resource_cells in _RESOURCE_CELLS.items():
+        used = sum(cells.get(cell, 0) for cell in resource_cells)
+        if used:
+            estimate[resource] = used
+    return estimate
+
+
+_STATS_HEADING = re.compile(r"^\d+\.\d+\. Printing statistics\.$")
+_STATS_MODULE = re.compile(r"^=== (.+) ===$")
+# Yosys has printed stats as both "Number of cells: 30" followed by
+# "SB_LUT4 13" lines, and "30 cells" followed by "13 SB_LUT4" lines.
+_STATS_CELLS = re.compile(r"^\s+(?:Number of cells:\s+\d+|\d+\s+cells)$")
+_STATS_CELL_OLD = re.compile(r"^\s+(\S+)\s+(\d+)$")
+_STATS_CELL_NEW = re.compile(r"^\s+(\d+)\s+(\S+)$")
+
+
+def _parse_yosys_stats(lines) -> dict[str, dict[str, int]]:
+    cells = {}
+    module = None
+    in_cells = False
+    for line in lines:
+        line = line.rstrip()
+        if _STATS_HEADING.match(line):
+            # Only the last set of statistics printed is of interest.
+            cells = {}
+            module = None
+        elif m := _STATS_MODULE.match(line):
+            module = None if m[1] == "design hierarchy" else m[1]
+            if module is not None:
+                cells[module] = {}
+            in_cells = False
+        elif module is None:
+            continue
+        elif _STATS_CELLS.match(line):
+            in_cells = True
+        elif in_cells and (m := _STATS_CELL_OLD.match(line)):
+            cells[module][m[1]] = int(m[2])
+        elif in_cells and (m := _STATS_CELL_NEW.match(line)):
+            cells[module][m[2]] = int(m[1])
+        else:
+            in_cells = False
+    return cells
+
+
+_NEXTPNR_UTILISATION = re.compile(r"^Info: Device utilisation:$")
+_NEXTPNR_RESOURCE = re.compile(r"^Info:\s+(\S+):\s+(\d+)/\s*(\d+)\s+\d+%$")
+_NEXTPNR_FMAX = re.compile(
+    r"^(?:Info|Warning): Max frequency for clock '(.+)': ([\d.]+) MHz \((PASS|FAIL) at ([\d.]+) MHz\)$")
+_NEXTPNR_SLACK = re.compile(r"^Info: Slack histogram:$")
+_NEXTPNR_SLACK_LEGEND = re.compile(r"^Info:\s+legend: \* represents (\d+) endpoint")
+_NEXTPNR_SLACK_BIN = re.compile(r"^Info: \[\s*(-?\d+),\s*(-?\d+)\)\s*\|(\**)(\+?)")
+
+
+def _parse_nextpnr_log(lines):
+    utilisation = {}
+    fmax = {}
+    slack_histogram = []
+    in_utilisation = False
+    in_slack = False
+    per_star = 1
+    for line in lines:
+        line = line.rstrip()
+        if _NEXTPNR_UTILISATION.match(line):
+            utilisation = {}
+            in_utilisation = True
+        elif in_utilisation and (m := _NEXTPNR_RESOURCE.match(line)):
+            utilisation[m[1]] = Utilisation(used=int(m[2]), available=int(m[3]))
+        elif m := _NEXTPNR_FMAX.match(line):
+            # Estimates are given after placement; those after routing win.
+            fmax[m[1]] = ClockTiming(
+                achieved_mhz=float(m[2]), target_mhz=float(m[4]), passed=m[3] == "PASS")
+        elif _NEXTPNR_SLACK.match(line):
+            slack_histogram = []
+            in_slack = True
+        elif in_slack and (m := _NEXTPNR_SLACK_LEGEND.match(line)):
+            per_star = int(m[1])
+        elif in_slack and (m := _NEXTPNR_SLACK_BIN.match(line)):
+            slack_histogram.append(SlackBin(
+                lower=int(m[1]),
+                upper=int(m[2]),
+                endpoints=len(m[3]) * per_star + (1 if m[4] else 0),
+            ))
+        elif in_slack and "represents" in line:
+            continue
+        else:
+            in_utilisation = False
+            in_slack = False
+    return utilisation, fmax, slack_histogram
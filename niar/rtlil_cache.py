@@ -0,0 +1,286 @@
+import enum
+import functools
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Optional
+
+from .logging import logger
+
+__all__ = ["RtlilCache", "cache_rtlil"]
+
+
+def cache_rtlil(cls):
+    """
+    Mark a ``wiring.Component`` to be converted to RTLIL on its own during
+    ``build`` and ``cxxrtl``, and instantiated by the enclosing design as a
+    black box. Its RTLIL is cached until the Python it ran while being
+    elaborated changes, or it's constructed with different arguments.
+
+    Its constructor's arguments must be plain values: ``None``, bools,
+    numbers, strings, enum members, shapes, layouts, signatures, or tuples or
+    lists of them. Anything else raises ``TypeError`` while converting, as
+    there's no sound way to tell whether it's what the cached RTLIL was
+    converted with.
+
+    The component must only connect to the rest of the design through its
+    signature and clock domains. Marked components within a marked component
+    are elaborated as part of it.
+    """
+    init = cls.__init__
+    elaborate = cls.elaborate
+
+    @functools.wraps(init)
+    def __init__(self, *args, **kwargs):
+        self._niar_init_args = (args, kwargs)
+        init(self, *args, **kwargs)
+
+    @functools.wraps(elaborate)
+    def wrapped_elaborate(self, platform):
+        if RtlilCache.active is None:
+            return elaborate(self, platform)
+        return RtlilCache.active.instance(self, platform)
+
+    cls.__init__ = __init__
+    cls.elaborate = wrapped_elaborate
+    return cls
+
+
+# Ports Amaranth adds for clock domains the component uses but doesn't define.
+_DOMAIN_PORT = re.compile(r"^(?:(.+)_)?(clk|rst)$")
+_PORT = re.compile(r"^\s*wire (?:width \d+ )?(input|output|inout) \d+ +\\(\S+)$", re.MULTILINE)
+_TOP_ATTRIBUTE = re.compile(r"^attribute \\top 1\n", re.MULTILINE)
+# Bumped when manifests written before would be wrong: before 1, they could
+# list submodules' ports.
+_MANIFEST_VERSION = 1
+
+
+class RtlilCache:
+    """
+    While active, components marked with :func:`cache_rtlil` elaborate to
+    an ``Instance`` of a module converted separately, and stored under
+    ``directory`` together with the source files it depends on. The
+    modules used are collected in ``modules``, keyed on name, for the caller
+    to pass on to Yosys alongside the design.
+    """
+
+    active: Optional["RtlilCache"] = None
+
+    def __init__(self, directory, *, force=False):
+        from .cmdrunner import DigestDatabase
+
+        self.directory = Path(directory)
+        self.force = force
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db = DigestDatabase(self.directory)
+        self.modules: dict[str, str] = {}
+
+    def __enter__(self):
+        assert RtlilCache.active is None
+        RtlilCache.active = self
+        return self
+
+    def __exit__(self, *exc):
+        RtlilCache.active = None
+        self.db.save()
+
+    def instance(self, component, platform):
+        from amaranth.hdl import ClockSignal, Instance, ResetSignal
+
+        cls = type(component)
+        key = _key(component, platform)
+        name = f"{cls.__name__}_{key[:12]}"
+        manifest_path = self.directory / f"{name}.json"
+        il_path = self.directory / f"{name}.il"
+
+        manifest = None if self.force else self._load(manifest_path, il_path)
+        if manifest is None:
+            logger.debug(f"converting {cls.__qualname__} separately as {name!r}")
+            rtlil_text, files = self._convert(component, platform, name)
+            ports = [[port, direction] for direction, port in _PORT.findall(_module(rtlil_text, name))]
+            manifest = {"version": _MANIFEST_VERSION, "ports": ports}
+            # Without knowing what it depends on, it can't be reused.
+            if files is not None:
+                manifest["files"] = {path: self.db.file_digest(path) for path in sorted(files)}
+                il_path.write_text(rtlil_text)
+                with open(manifest_path, "w") as f:
+                    json.dump(manifest, f, indent=2)
+        else:
+            logger.debug(f"reusing RTLIL of {cls.__qualname__} as {name!r}")
+            rtlil_text = il_path.read_text()
+        self.modules[name] = rtlil_text
+
+        values = {
+            "__".join(map(str, path)): value
+            for path, _member, value in component.signature.flatten(component)
+        }
+        kwargs = {}
+        for port, direction in manifest["ports"]:
+            if port in values:
+                value = values[port]
+            elif m := _DOMAIN_PORT.match(port):
+                domain = m[1] or "sync"
+                value = (ClockSignal(domain) if m[2] == "clk" else
+                         ResetSignal(domain, allow_reset_less=True))
+            else:
+                raise RuntimeError(f"{cls.__qualname__} has port {port!r} which isn't in its signature")
+            kwargs[f"{direction[0]}_{port}"] = value
+        return Instance(name, **kwargs)
+
+    def _load(self, manifest_path, il_path):
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if manifest.get("version") != _MANIFEST_VERSION or not il_path.exists():
+            return None
+        for path, digest in manifest["files"].items():
+            if self.db.file_digest(path) != digest:
+                logger.debug(f"{path} changed")
+                return None
+        return manifest
+
+    def _convert(self, component, platform, name):
+        from amaranth.back import rtlil
+
+        # Anything called while we elaborate and convert may affect the
+        # result. Amaranth itself is covered by its version, in the key.
+        files = set()
+
+        def py_start(code, _offset):
+            # Not DISABLE: re-arming disabled locations would take
+            # restart_events(), which re-arms every other tool's too. This
+            # only runs for the length of the conversion.
+            files.add(code.co_filename)
+
+        # Not one of the IDs reserved for debuggers, coverage or profilers,
+        # so we don't get in the way of e.g. cProfile.
+        tool = next((tool for tool in range(3, 6) if sys.monitoring.get_tool(tool) is None), None)
+        if tool is None:
+            logger.warning(f"no sys.monitoring tool ID free to see what {type(component).__qualname__} "
+                           f"depends on; its RTLIL won't be cached")
+        else:
+            sys.monitoring.use_tool_id(tool, "niar")
+            sys.monitoring.register_callback(tool, sys.monitoring.events.PY_START, py_start)
+            sys.monitoring.set_events(tool, sys.monitoring.events.PY_START)
+        # Marked components within this one are elaborated as usual.
+        RtlilCache.active = None
+        try:
+            rtlil_text = rtlil.convert(component, name=name, platform=platform)
+        finally:
+            RtlilCache.active = self
+            if tool is not None:
+                sys.monitoring.set_events(tool, 0)
+                sys.monitoring.register_callback(tool, sys.monitoring.events.PY_START, None)
+                sys.monitoring.free_tool_id(tool)
+        # Only the design's top module should claim to be the top.
+        rtlil_text = _TOP_ATTRIBUTE.sub("", rtlil_text, count=1)
+        if tool is None:
+            return rtlil_text, None
+
+        for cls in type(component).__mro__:
+            try:
+                files.add(inspect.getfile(cls))
+            except TypeError:
+                pass  # builtin
+
+        files = {
+            os.path.abspath(path) for path in files
+            if os.path.isfile(path) and not _is_toolchain_source(os.path.abspath(path))
+        }
+        return rtlil_text, files
+
+
+def _module(rtlil_text, name) -> str:
+    """
+    The body of module ``name`` in ``rtlil_text``, without those of its
+    submodules, whose ports aren't the component's.
+    """
+    m = re.search(rf"^module \\{re.escape(name)}\n(.*?)^end$", rtlil_text, re.MULTILINE | re.DOTALL)
+    if m is None:
+        raise RuntimeError(f"no module {name!r} in its RTLIL")
+    return m[1]
+
+
+def _is_toolchain_source(path) -> bool:
+    import sysconfig
+
+    amaranth = os.path.dirname(sys.modules["amaranth"].__file__)
+    paths = sysconfig.get_paths()
+    if path.startswith(amaranth + os.sep):
+        return True
+    if path.startswith((paths["purelib"] + os.sep, paths["platlib"] + os.sep)):
+        return False
+    return path.startswith(paths["stdlib"] + os.sep)
+
+
+def _key(component, platform) -> str:
+    from amaranth import __version__ as amaranth_version
+
+    cls = type(component)
+    args, kwargs = component._niar_init_args
+    init_args = json.dumps([
+        [_stable(cls, f"#{index}", arg) for index, arg in enumerate(args)],
+        {name: _stable(cls, repr(name), arg) for name, arg in kwargs.items()},
+    ], sort_keys=True)
+    m = hashlib.sha256()
+    for part in [
+        _qualname(cls),
+        init_args,
+        _qualname(type(platform)),
+        amaranth_version,
+    ]:
+        m.update(part.encode())
+        m.update(b"\0")
+    return m.hexdigest()
+
+
+def _stable(cls, where, value):
+    """
+    A serialisation of constructor argument ``value`` which only compares
+    equal to another's if they're the same; ``repr`` can leave out state,
+    or include object addresses.
+    """
+    from amaranth.hdl import Shape
+    from amaranth.lib import data, wiring
+
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return ["float", value.hex()]
+    if isinstance(value, enum.Enum):
+        return ["enum", _qualname(type(value)), value.name]
+    if isinstance(value, (tuple, list)):
+        return [type(value).__name__, [_stable(cls, where, elem) for elem in value]]
+    if isinstance(value, Shape):
+        return ["shape", value.width, value.signed]
+    if isinstance(value, type) and issubclass(value, enum.Enum):
+        return ["enum class", _qualname(value),
+                [[member.name, _stable(cls, where, member.value)] for member in value]]
+    if isinstance(value, type) and issubclass(value, (data.Struct, data.Union)):
+        return ["aggregate", _qualname(value), _stable(cls, where, data.Layout.cast(value))]
+    if isinstance(value, data.Layout):
+        return ["layout", _qualname(type(value)), value.size,
+                [[name, _stable(cls, where, field.shape), field.offset] for name, field in value]]
+    if isinstance(value, wiring.Signature):
+        members = []
+        for name, member in value.members.items():
+            if member.is_port:
+                described = ["port", _stable(cls, where, member.shape), _stable(cls, where, member.init)]
+            else:
+                described = ["signature", _stable(cls, where, member.signature)]
+            members.append([name, member.flow.name, list(member.dimensions), *described])
+        return ["signature", _qualname(type(value)), members]
+    raise TypeError(f"{cls.__qualname__} can't have its RTLIL cached: argument {where} is a "
+                    f"{type(value).__qualname__}, which can't be compared soundly. Only None, bools, "
+                    f"numbers, strings, enums, shapes, layouts, signatures and tuples or lists of "
+                    f"them can.")
+
+
+def _qualname(cls) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
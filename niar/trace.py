@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+__all__ = ["Tracer", "span", "start", "tracing"]
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace events, viewable in Perfetto or
+    chrome://tracing. Spans on different threads or processes get their own
+    tracks.
+    """
+
+    def __init__(self, process_name: str = "niar"):
+        self.lock = threading.Lock()
+        self.events = [{
+            "name": "process_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "args": {"name": process_name},
+        }]
+        self.threads = set()
+
+    @contextmanager
+    def span(self, name: str, **args):
+        # Wall-clock rather than monotonic, so spans from several processes
+        # line up.
+        start = time.time_ns()
+        try:
+            yield args
+        finally:
+            finish = time.time_ns()
+            thread = threading.current_thread()
+            with self.lock:
+                if thread.ident not in self.threads:
+                    self.threads.add(thread.ident)
+                    self.events.append({
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": os.getpid(),
+                        "tid": thread.ident,
+                        "args": {"name": thread.name},
+                    })
+                self.events.append({
+                    "name": name,
+                    "cat": "niar",
+                    "ph": "X",
+                    "ts": start / 1000,
+                    "dur": (finish - start) / 1000,
+                    "pid": os.getpid(),
+                    "tid": thread.ident,
+                    "args": args,
+                })
+
+    def save(self, path):
+        with self.lock:
+            with open(path, "w") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+
+tracer: Optional[Tracer] = None
+
+
+def start(process_name: str = "niar") -> Tracer:
+    global tracer
+    tracer = Tracer(process_name)
+    return tracer
+
+
+@contextmanager
+def span(name: str, **args):
+    """
+    Record a span if we're tracing. Yields a dict of the span's arguments,
+    which may be added to before it ends.
+    """
+    if tracer is None:
+        yield args
+    else:
+        with tracer.span(name, **args) as args:
+            yield args
+
+
+@contextmanager
+def tracing(path: Optional[str]):
+    global tracer
+    if path is None:
+        yield
+        return
+    start()
+    try:
+        yield
+    finally:
+        tracer.save(path)
+        tracer = None
@@ -0,0 +1,129 @@
+import json
+import multiprocessing
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from amaranth import Elaboratable, Module
+from amaranth_boards.icebreaker import ICEBreakerPlatform
+from amaranth_boards.icebreaker_bitsy import ICEBreakerBitsyPlatform
+
+from niar import Project, build
+from niar.build import add_synthesis_and_pnr, parse_seeds, select_seed
+from niar.cmdrunner import CommandRunner
+
+
+class TwoBoardTop(Elaboratable):
+    def elaborate(self, platform):
+        return Module()
+
+
+class TwoBoardProject(Project):
+    name = "twoboard"
+    top = TwoBoardTop
+    targets = [ICEBreakerPlatform, ICEBreakerBitsyPlatform]
+
+
+def _received(np, args):
+    return type(np).__name__, np.name, args.board, str(np.path.build())
+
+
+def test_board_workers_receive_project_and_args_under_spawn():
+    # As on macOS and Windows, where each board's worker is a fresh
+    # interpreter the project and arguments are pickled across to.
+    np = TwoBoardProject()
+    parser = ArgumentParser()
+    build.add_arguments(np, parser)
+    args = parser.parse_args(["-b", "all", "-b", "ICEBreakerPlatform"])
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        received = pool.submit(_received, np, args).result()
+    assert received == ("TwoBoardProject", "twoboard", args.board, str(np.path.build()))
+
+
+def _tim(mhz, target=12.0):
+    verdict = "PASS" if mhz >= target else "FAIL"
+    return f"Info: Max frequency for clock 'clk': {mhz:.2f} MHz ({verdict} at {target:.2f} MHz)\n"
+
+
+def _seed(build_dir, seed, status, tim=None, products=()):
+    seed_dir = build_dir / f"seed-{seed}"
+    seed_dir.mkdir()
+    (seed_dir / "pnr.status").write_text(str(status))
+    (seed_dir / "top.json").write_text("netlist")
+    if tim is not None:
+        (seed_dir / "top.tim").write_text(tim)
+    for fn in products:
+        (seed_dir / fn).write_text(f"seed {seed}")
+
+
+def test_parse_seeds():
+    assert parse_seeds("3") == [1, 2, 3]
+    assert parse_seeds("1,5,9") == [1, 5, 9]
+    assert parse_seeds("7,") == [7]
+
+
+def test_selects_seed_with_most_headroom(tmp_path):
+    _seed(tmp_path, 1, 0, _tim(40.0), ["top.bin"])
+    _seed(tmp_path, 2, 0, _tim(55.5), ["top.bin"])
+    _seed(tmp_path, 3, 1)
+    (tmp_path / "top.json").write_text("netlist")
+
+    assert select_seed(tmp_path, "top", [1, 2, 3], keep=["top.json"]) == 0
+
+    assert (tmp_path / "top.bin").read_text() == "seed 2"
+    assert "55.50" in (tmp_path / "top.tim").read_text()
+    seeds = json.loads((tmp_path / "top.seeds.json").read_text())
+    assert seeds["best"] == 2
+    assert [r["status"] for r in seeds["results"]] == [0, 0, 1]
+    assert seeds["results"][0]["fmax"] == {"clk": 40.0}
+    assert seeds["results"][2]["log"] == str(tmp_path / "seed-3" / "pnr.log")
+
+
+def test_every_seed_failing_leaves_nothing_stale(tmp_path):
+    # From a previous build, in which seed 1 succeeded.
+    (tmp_path / "top.seeds.json").write_text(json.dumps({
+        "best": 1, "results": [], "products": ["top.bin", "top.tim"],
+    }))
+    (tmp_path / "top.bin").write_text("seed 1")
+    (tmp_path / "top.tim").write_text(_tim(40.0))
+    _seed(tmp_path, 1, 1)
+    _seed(tmp_path, 2, 1)
+    (tmp_path / "top.json").write_text("netlist")
+
+    assert select_seed(tmp_path, "top", [1, 2], keep=["top.json"]) == 1
+
+    assert not (tmp_path / "top.seeds.json").exists()
+    assert not (tmp_path / "top.bin").exists()
+    assert not (tmp_path / "top.tim").exists()
+    assert (tmp_path / "top.json").exists()
+
+
+def _add_build(np, monkeypatch, tmp_path, **kwargs):
+    monkeypatch.setattr(type(np.path), "build", lambda self, *parts: tmp_path.joinpath(*parts))
+    platform = ICEBreakerPlatform()
+    plan = platform.prepare(TwoBoardTop(), np.name)
+    del plan.files[f"{np.name}.il"]
+    cr = CommandRunner()
+    add_synthesis_and_pnr(np, cr, plan, "board", toolchain_env_var=platform._toolchain_env_var,
+                          **kwargs)
+    return cr
+
+
+def test_toolchain_environment_runs_the_build_script(tmp_path, monkeypatch):
+    np = TwoBoardProject()
+    monkeypatch.delenv("AMARANTH_ENV_IceStorm", raising=False)
+    cr = _add_build(np, monkeypatch, tmp_path)
+    assert [cu.outf for cu in cr.cus] == [str(tmp_path / "board" / fn)
+                                          for fn in ["twoboard.json", "twoboard.pnr"]]
+
+    # The build script sources the environment script; running its commands
+    # one by one wouldn't.
+    monkeypatch.setenv("AMARANTH_ENV_IceStorm", os.devnull)
+    cr = _add_build(np, monkeypatch, tmp_path)
+    assert [cu.outf for cu in cr.cus] == [str(tmp_path / "board" / "twoboard.built")]
+    with pytest.raises(RuntimeError, match=r"--seeds can't be used with AMARANTH_ENV_IceStorm set"):
+        _add_build(np, monkeypatch, tmp_path, seeds=[1, 2])
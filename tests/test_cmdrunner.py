@@ -0,0 +1,279 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from niar.cache import ArtifactCache
+from niar.cmdrunner import CommandFailedError, CommandRunner, DigestDatabase, parse_depfile
+
+
+def test_runs_dependencies_first(tmp_path):
+    order = []
+    a_path = tmp_path / "a"
+    b_path = tmp_path / "b"
+
+    def make_a():
+        time.sleep(0.05)
+        a_path.write_text("a")
+        order.append("a")
+
+    def make_b():
+        b_path.write_text(a_path.read_text() + "b")
+        order.append("b")
+
+    cr = CommandRunner(jobs=4)
+    # Added out of order; b depends on a via its inputs.
+    cr.add_process(make_b, infs=[a_path], outf=b_path)
+    cr.add_process(make_a, infs=[], outf=a_path)
+    cr.run()
+
+    assert order == ["a", "b"]
+    assert b_path.read_text() == "ab"
+
+
+def test_explicit_deps(tmp_path):
+    order = []
+
+    def first():
+        time.sleep(0.05)
+        order.append("first")
+
+    def second():
+        order.append("second")
+
+    cr = CommandRunner(jobs=4)
+    cu = cr.add_process(first, infs=[], outf=None)
+    cr.add_process(second, infs=[], outf=None, deps=[cu])
+    cr.run()
+
+    assert order == ["first", "second"]
+
+
+def test_jobs_limits_concurrency():
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def unit():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+
+    cr = CommandRunner(jobs=2)
+    for _ in range(6):
+        cr.add_process(unit, infs=[], outf=None)
+    cr.run()
+
+    assert peak == 2
+
+
+def test_failure_skips_dependents(tmp_path):
+    ran = []
+
+    def dependent():
+        ran.append("dependent")
+
+    cr = CommandRunner(jobs=2)
+    cu = cr.add_process(["false"], infs=[], outf=None)
+    cr.add_process(dependent, infs=[], outf=None, deps=[cu])
+    with pytest.raises(CommandFailedError):
+        cr.run()
+
+    assert ran == []
+
+
+def test_parse_depfile(tmp_path):
+    d_path = tmp_path / "main.d"
+    d_path.write_text("build/main.o: cxxrtl/main.cc build/top.h \\\n  dir\\ with\\ spaces/a.h\n")
+
+    assert parse_depfile(d_path) == ["cxxrtl/main.cc", "build/top.h", "dir with spaces/a.h"]
+
+
+def test_depfile_inputs_invalidate(tmp_path):
+    header = tmp_path / "top.h"
+    header.write_text("one")
+    d_path = tmp_path / "main.d"
+    o_path = tmp_path / "main.o"
+    runs = []
+
+    def compile():
+        d_path.write_text(f"{o_path}: {header}\n")
+        runs.append(header.read_text())
+
+    def build():
+        cr = CommandRunner()
+        cr.add_process(compile, infs=[], outf=o_path, depfile=d_path)
+        cr.run()
+
+    build()
+    build()
+    header.write_text("two")
+    build()
+
+    assert runs == ["one", "two"]
+
+
+def test_digest_database_skips_unchanged_files(tmp_path, monkeypatch):
+    inf = tmp_path / "in"
+    inf.write_text("content")
+    old = 1_000_000_000_000_000_000
+    os.utime(inf, ns=(old, old))
+
+    db = DigestDatabase(tmp_path)
+    digest = db.file_digest(str(inf))
+    db.save()
+
+    opened = []
+    real_open = open
+    def spy_open(path, *args, **kwargs):
+        opened.append(str(path))
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr("builtins.open", spy_open)
+
+    db = DigestDatabase(tmp_path)
+    assert db.file_digest(str(inf)) == digest
+    assert str(inf) not in opened
+
+
+def test_digest_databases_saving_at_once(tmp_path):
+    # As when several boards' builds share one, each in its own process.
+    errors = []
+
+    def save_repeatedly(n):
+        try:
+            for i in range(50):
+                db = DigestDatabase(tmp_path)
+                db.set_unit_digest(f"unit-{n}-{i}", "digest")
+                db.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save_repeatedly, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert os.listdir(tmp_path) == [DigestDatabase.FILENAME]
+    assert json.loads((tmp_path / DigestDatabase.FILENAME).read_text())["units"]
+
+
+def test_artifact_cache_restores_after_clean(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ArtifactCache(tmp_path / "cache", max_size=1 << 20)
+    build_dir = tmp_path / "build"
+    runs = []
+
+    def synthesize():
+        build_dir.mkdir(exist_ok=True)
+        (build_dir / "top.bin").write_text("bitstream")
+        runs.append(True)
+
+    def build():
+        cr = CommandRunner(cache=cache)
+        cr.add_process(synthesize, infs=[{"build/top.il": "rtlil"}], outf=build_dir / "top.bin",
+                       artifacts=["top.*"])
+        cr.run()
+
+    build()
+    shutil.rmtree(build_dir)
+    build()
+
+    assert len(runs) == 1
+    assert (build_dir / "top.bin").read_text() == "bitstream"
+
+
+def test_artifact_cache_misses_without_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ArtifactCache(tmp_path / "cache", max_size=1 << 20)
+    build_dir = tmp_path / "build"
+    runs = []
+
+    def synthesize():
+        build_dir.mkdir(exist_ok=True)
+        (build_dir / "top.rpt").write_text("report")
+        runs.append(True)
+
+    def build():
+        cr = CommandRunner(cache=cache)
+        cr.add_process(synthesize, infs=[{"build/top.il": "rtlil"}], outf=build_dir / "top.bin",
+                       artifacts=["top.*"])
+        cr.run()
+
+    build()
+    shutil.rmtree(build_dir)
+    build()
+
+    assert len(runs) == 2
+
+
+def test_artifact_cache_ignores_empty_and_vanishing_entries(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", max_size=1 << 20)
+    cache.store("aa01", [])
+    assert not cache.entry("aa01").exists()
+    assert not cache.restore("aa01", tmp_path / "out")
+
+    # As if evicted between listing the entry and copying from it.
+    cache.entry("aa02").mkdir(parents=True)
+    (cache.entry("aa02") / "top.bin").symlink_to(tmp_path / "gone")
+    assert not cache.restore("aa02", tmp_path / "out")
+
+
+def test_artifact_cache_evicts_least_recently_used(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", max_size=10)
+    for i, key in enumerate(["aa01", "aa02", "aa03"]):
+        path = tmp_path / f"{key}.bin"
+        path.write_bytes(b"12345")
+        cache.store(key, [path])
+        os.utime(cache.entry(key), ns=(i, i))
+    cache.evict()
+
+    assert not cache.entry("aa01").exists()
+    assert cache.entry("aa03").exists()
+
+
+def test_traces_units(tmp_path):
+    from niar import trace
+
+    a_path = tmp_path / "a"
+    trace_path = tmp_path / "trace.json"
+
+    def make_a():
+        a_path.write_text("a")
+
+    with trace.tracing(trace_path):
+        for _ in range(2):
+            cr = CommandRunner()
+            cr.add_process(make_a, infs=[], outf=a_path)
+            cr.run()
+
+    events = [e for e in json.loads(trace_path.read_text())["traceEvents"] if e["ph"] == "X"]
+    assert [e["args"] for e in events] == [
+        {"result": "run", "status": 0},
+        {"result": "skip", "status": 0},
+    ]
+    assert trace.tracer is None
+
+
+def test_launcher_not_digested(tmp_path):
+    out_path = tmp_path / "out"
+    log_path = tmp_path / "log"
+
+    def build(launcher):
+        cr = CommandRunner()
+        cr.add_process(["sh", "-c", f'echo "$0" >> {log_path}; touch {out_path}'],
+                       infs=[], outf=out_path, launcher=launcher)
+        cr.run()
+
+    build(["env", "LAUNCHED=1"])
+    build([])
+
+    assert log_path.read_text() == "sh\n"
@@ -0,0 +1,60 @@
+from niar.complexity import DesignComplexity
+
+
+RTLIL = """\
+attribute \\top 1
+module \\top
+  wire width 8 input 0 \\a
+  wire width 8 output 1 \\b
+  wire \\c
+  cell \\top.sub \\first
+    connect \\a \\a
+  end
+  cell \\top.sub \\second
+    connect \\a \\a
+  end
+  cell $mem_v2 $1
+    parameter \\WIDTH 8
+    parameter \\SIZE 16
+  end
+end
+
+module \\top.sub
+  wire width 8 input 0 \\a
+  wire width 8 \\r
+  cell $add $1
+    parameter \\A_WIDTH 8
+  end
+  process $2
+    assign \\r \\a
+    switch \\a [0]
+      case 1'1
+        assign \\r 8'00000000
+      case
+    end
+    sync posedge \\clk
+      update \\r \\r
+  end
+end
+"""
+
+
+def test_counts_per_module_and_flattened(tmp_path):
+    path = tmp_path / "top.il"
+    path.write_text(RTLIL)
+    complexity = DesignComplexity.from_rtlil(path)
+
+    assert complexity.top == "top"
+    top, sub = complexity.modules["top"], complexity.modules["top.sub"]
+    assert top.cells == {"$mem_v2": 1}
+    assert top.submodules == {"top.sub": 2}
+    assert (top.wires, top.wire_bits) == (3, 17)
+    assert (top.memories, top.memory_bits) == (1, 128)
+    assert sub.cells == {"$add": 1}
+    assert (sub.processes, sub.statements) == (1, 2)
+
+    flat = complexity.flattened("top")
+    assert flat.cells == {"$mem_v2": 1, "$add": 2}
+    assert flat.statements == 4
+    assert flat.size == 7
+    assert complexity.instances() == {"top": 1, "top.sub": 2}
@@ -0,0 +1,59 @@
+from niar.cxxrtl_split import split_cxxrtl
+
+
+SOURCE = """\
+#include "top.h"
+
+#if defined(CXXRTL_INCLUDE_CAPI_IMPL)
+#include <cxxrtl/capi/cxxrtl_capi.cc>
+#endif
+
+using namespace cxxrtl_yosys;
+
+namespace cxxrtl_design {
+
+void p_top::reset() {
+	p_a = wire<1>{0u};
+}
+
+bool p_top::eval(performer *performer) {
+	bool converged = true;
+	p_b = p_a.curr;
+	if (true) {
+		p_a.next = not_u<1>(p_a.curr);
+	}
+	return converged;
+}
+
+CXXRTL_EXTREMELY_COLD
+void p_top::debug_info(debug_items *items, debug_scopes *scopes, std::string path, metadata_map &&cell_attrs) {
+	if (items) {
+		items->add(path, "a", "", p_a, 0, debug_item::DRIVEN_SYNC);
+	}
+}
+
+} // namespace cxxrtl_design
+
+extern "C"
+cxxrtl_toplevel cxxrtl_design_create() {
+	return new _cxxrtl_toplevel { std::unique_ptr<cxxrtl_design::p_top>(new cxxrtl_design::p_top) };
+}
+"""
+
+
+def test_splits_definitions():
+    shards = split_cxxrtl(SOURCE, 3)
+    assert len(shards) == 3
+    assert "p_top::eval" in shards[0]
+    assert "cxxrtl_capi.cc" in shards[0]
+    assert "cxxrtl_design_create" in shards[0]
+    for shard in shards[1:]:
+        assert shard.startswith('#include "top.h"\nusing namespace cxxrtl_yosys;\n')
+        assert "cxxrtl_capi.cc" not in shard
+    assert "CXXRTL_EXTREMELY_COLD\nvoid p_top::debug_info" in shards[1]
+    assert "p_top::reset" in shards[2]
+
+
+def test_keeps_unexpected_source_whole():
+    source = SOURCE.replace("void p_top::reset() {", "static void helper() {")
+    assert split_cxxrtl(source, 2) == [source, ""]
@@ -0,0 +1,55 @@
+import importlib
+import sys
+
+from niar.elaboration import ElaborationCache
+
+
+def test_reuses_files_with_same_digest(tmp_path):
+    (tmp_path / "top.il").write_text("module \\top\nend\n")
+    ElaborationCache(tmp_path, "abc").save(["top.il"])
+
+    assert ElaborationCache(tmp_path, "abc").load() == ["top.il"]
+    assert ElaborationCache(tmp_path, "def").load() is None
+
+
+def test_invalidated_by_changed_files(tmp_path):
+    (tmp_path / "top.il").write_text("module \\top\nend\n")
+    ElaborationCache(tmp_path, "abc").save(["top.il"])
+    (tmp_path / "top.il").write_text("module \\top\n  wire \\w\nend\n")
+
+    assert ElaborationCache(tmp_path, "abc").load() is None
+
+    (tmp_path / "top.il").unlink()
+    assert ElaborationCache(tmp_path, "abc").load() is None
+
+
+def test_invalidated_by_changed_dependencies(tmp_path, monkeypatch):
+    # A design library outside the project, and a data file elaboration reads.
+    (tmp_path / "extlib").mkdir()
+    (tmp_path / "extlib" / "extlib_mod.py").write_text("WIDTH = 8\n")
+    (tmp_path / "rom.hex").write_text("00\n")
+    (tmp_path / "build").mkdir()
+    monkeypatch.syspath_prepend(str(tmp_path / "extlib"))
+    monkeypatch.delitem(sys.modules, "extlib_mod", raising=False)
+
+    cache = ElaborationCache(tmp_path / "build", "abc")
+    with cache.recording(exclude=tmp_path / "build"):
+        importlib.import_module("extlib_mod")
+        (tmp_path / "rom.hex").read_text()
+        (tmp_path / "build" / "scratch").write_text("")
+    (tmp_path / "build" / "top.il").write_text("module \\top\nend\n")
+    cache.save(["top.il"])
+    assert str(tmp_path / "extlib" / "extlib_mod.py") in cache.dependencies
+    assert str(tmp_path / "rom.hex") in cache.dependencies
+    assert not any("scratch" in path for path in cache.dependencies)
+
+    assert ElaborationCache(tmp_path / "build", "abc").load() == ["top.il"]
+
+    (tmp_path / "rom.hex").write_text("ff\n")
+    assert ElaborationCache(tmp_path / "build", "abc").load() is None
+    # Touched, but the same again.
+    (tmp_path / "rom.hex").write_text("00\n")
+    assert ElaborationCache(tmp_path / "build", "abc").load() == ["top.il"]
+
+    (tmp_path / "extlib" / "extlib_mod.py").write_text("WIDTH = 16\n")
+    assert ElaborationCache(tmp_path / "build", "abc").load() is None
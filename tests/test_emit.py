@@ -0,0 +1,85 @@
+import os
+
+import amaranth
+from amaranth import Elaboratable, Module, Signal
+from amaranth.back import rtlil
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+from amaranth_boards.icebreaker import ICEBreakerPlatform
+
+from niar.emit import can_stream, convert_to_file, streaming_prepare, streaming_supported
+
+
+convert_fragment = rtlil.convert_fragment
+
+
+class Inner(wiring.Component):
+    a: In(8)
+    b: Out(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.d.sync += self.b.eq(self.a + 1)
+        return m
+
+
+class Outer(wiring.Component):
+    a: In(8)
+    b: Out(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.first = first = Inner()
+        m.submodules.second = second = Inner()
+        m.d.comb += [first.a.eq(self.a), second.a.eq(first.b), self.b.eq(second.b)]
+        return m
+
+
+def test_matches_convert(tmp_path):
+    path = tmp_path / "top.il"
+    convert_to_file(Outer(), path, name="top", emit_src=False)
+
+    assert path.read_text() == rtlil.convert(Outer(), name="top", emit_src=False)
+
+
+def test_leaves_unchanged_file_alone(tmp_path):
+    path = tmp_path / "top.il"
+    convert_to_file(Outer(), path, name="top", emit_src=False)
+    os.utime(path, ns=(0, 0))
+    convert_to_file(Outer(), path, name="top", emit_src=False)
+
+    assert path.stat().st_mtime_ns == 0
+    assert os.listdir(tmp_path) == ["top.il"]
+
+
+class Blinky(Elaboratable):
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.inner = inner = Inner()
+        m.d.sync += inner.a.eq(inner.a + inner.b)
+        return m
+
+
+def test_streamed_prepare_matches_plan(tmp_path):
+    platform = ICEBreakerPlatform()
+    assert can_stream(platform, debug_verilog=False)
+    expected = platform.prepare(Blinky(), "top").files["top.il"]
+
+    path = tmp_path / "top.il"
+    platform = ICEBreakerPlatform()
+    with streaming_prepare(platform, path):
+        plan = platform.prepare(Blinky(), "top")
+
+    assert "module" not in plan.files["top.il"]
+    assert path.read_text() == expected
+    assert rtlil.convert_fragment is convert_fragment
+
+
+def test_untested_amaranth_converts_as_usual(tmp_path, monkeypatch):
+    monkeypatch.setattr(amaranth, "__version__", "0.99.0")
+    assert not streaming_supported()
+    assert not can_stream(ICEBreakerPlatform(), debug_verilog=False)
+
+    path = tmp_path / "top.il"
+    convert_to_file(Outer(), path, name="top", emit_src=False)
+    assert path.read_text() == rtlil.convert(Outer(), name="top", emit_src=False)
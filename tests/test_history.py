@@ -0,0 +1,77 @@
+from argparse import Namespace
+from types import SimpleNamespace
+
+import pytest
+
+from niar import history
+from niar.history import History
+from niar.report import BuildReport, ClockTiming, Utilisation
+
+
+@pytest.fixture
+def np(tmp_path):
+    # All History and main need of a project is where its build directory is.
+    return SimpleNamespace(path=SimpleNamespace(build=lambda *parts: tmp_path.joinpath(*parts)))
+
+
+def _at_revision(monkeypatch, revision):
+    monkeypatch.setattr(history, "git_revision", lambda np, rev="HEAD": (revision, False))
+
+
+def _report(lcs, mhz):
+    return BuildReport(
+        utilisation={"ICESTORM_LC": Utilisation(used=lcs, available=5280)},
+        fmax={"clk": ClockTiming(achieved_mhz=mhz, target_mhz=12.0, passed=True)},
+    )
+
+
+def _record(np, monkeypatch, revision, report):
+    _at_revision(monkeypatch, revision)
+    History(np.path.build("history.sqlite")).record(
+        np, board="ICEBreakerPlatform", design_digest="d", report=report, durations={"pnr": 1.5})
+
+
+def test_record_and_latest_round_trip(np, monkeypatch):
+    _record(np, monkeypatch, "aaaa", _report(100, 50.0))
+    _record(np, monkeypatch, "bbbb", _report(110, 48.0))
+
+    h = History(np.path.build("history.sqlite"))
+    latest = h.latest("ICEBreakerPlatform")
+    assert latest.revision == "bbbb"
+    assert latest.report == _report(110, 48.0)
+    assert latest.durations == {"pnr": 1.5}
+    assert h.latest("ICEBreakerPlatform", revision="aaaa").report == _report(100, 50.0)
+    assert h.latest("OtherPlatform") is None
+
+
+def _compare(np, threshold=5.0):
+    history.main(np, Namespace(board="ICEBreakerPlatform", compare="base", threshold=threshold,
+                               limit=10))
+
+
+@pytest.mark.parametrize("current, regressed", [
+    (_report(102, 49.5), False),
+    (_report(120, 50.0), True),
+    (_report(100, 40.0), True),
+])
+def test_compare_exits_past_threshold(np, monkeypatch, current, regressed):
+    _record(np, monkeypatch, "aaaa", _report(100, 50.0))
+    _record(np, monkeypatch, "bbbb", current)
+    _at_revision(monkeypatch, "aaaa")
+
+    if regressed:
+        with pytest.raises(SystemExit) as e:
+            _compare(np)
+        assert e.value.code == 1
+    else:
+        _compare(np)
+
+
+def test_compare_flags_change_from_zero(np, monkeypatch):
+    _record(np, monkeypatch, "aaaa", _report(0, 50.0))
+    _record(np, monkeypatch, "bbbb", _report(3, 50.0))
+    _at_revision(monkeypatch, "aaaa")
+
+    with pytest.raises(SystemExit) as e:
+        _compare(np)
+    assert e.value.code == 1
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+
+HEAVY = ["amaranth.build", "amaranth.back.rtlil", "amaranth._toolchain.yosys"]
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+
+def test_import_is_light():
+    # Defining a project or command shouldn't pull in the build machinery.
+    for module in ["niar", "niar.build", "niar.cxxrtl", "niar.history"]:
+        loaded = run_python(
+            f"import sys, {module}; print(*[m for m in {HEAVY!r} if m in sys.modules])"
+        ).stdout.split()
+        assert loaded == [], f"importing {module} loads {loaded}"
+
+    # Nor should defining a project, before a command's been chosen.
+    loaded = run_python(
+        "import sys\n"
+        "from amaranth import Elaboratable\n"
+        "from niar import Project\n"
+        "class Top(Elaboratable):\n"
+        "    pass\n"
+        "class P(Project):\n"
+        "    name = 'p'\n"
+        "    top = Top\n"
+        "    targets = []\n"
+        f"print(*[m for m in {HEAVY!r} if m in sys.modules])"
+    ).stdout.split()
+    assert loaded == [], f"defining a project loads {loaded}"
+
+
+@pytest.mark.skipif(not os.getenv("NIAR_TEST_TIMING"),
+                    reason="wall-clock; set NIAR_TEST_TIMING=1 to run")
+def test_import_time():
+    # Generous, so as to only catch gross regressions: the Amaranth import
+    # alone is several times this.
+    baseline = min(timed_import("json") for _ in range(3))
+    elapsed = min(timed_import("niar") for _ in range(3))
+    assert elapsed - baseline < 0.1, f"importing niar took {elapsed - baseline:.3f}s"
+
+
+def timed_import(module):
+    start = time.perf_counter()
+    run_python(f"import {module}")
+    return time.perf_counter() - start
@@ -0,0 +1,46 @@
+from amaranth import Module
+from amaranth.back import rtlil
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+
+from niar.profiling import ElaborationProfile
+
+
+class Inner(wiring.Component):
+    a: In(8)
+    b: Out(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.d.sync += self.b.eq(self.a + 1)
+        return m
+
+
+class Outer(wiring.Component):
+    a: In(8)
+    b: Out(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.first = first = Inner()
+        m.submodules.second = second = Inner()
+        m.d.comb += [first.a.eq(self.a), second.a.eq(first.b), self.b.eq(second.b)]
+        return m
+
+
+def test_attributes_by_module_path(tmp_path):
+    profile = ElaborationProfile()
+    with profile("top"):
+        rtlil.convert(Outer(), name="top")
+
+    paths = {(e.path, e.cls) for e in profile.elaborations}
+    assert {
+        (("top",), "Outer"),
+        (("top", "first"), "Inner"),
+        (("top", "second"), "Inner"),
+    } <= paths
+
+    profile.save(tmp_path / "elaboration")
+    folded = (tmp_path / "elaboration.folded").read_text().splitlines()
+    assert {line.rsplit(" ", 1)[0] for line in folded} >= {"top", "top;first", "top;second"}
+    assert (tmp_path / "elaboration.pstats").exists()
@@ -0,0 +1,103 @@
+from niar.report import BuildReport, ClockTiming, SlackBin, Utilisation, estimate_utilisation
+
+
+YOSYS_RPT = """\
+2.49. Printing statistics.
+
+=== top ===
+
+   Number of wires:                 12
+   Number of cells:                 30
+     SB_CARRY                        8
+     SB_DFF                          9
+     SB_LUT4                        13
+
+2.50. Executing JSON backend.
+"""
+
+YOSYS_RPT_NEW = """\
+3.51. Printing statistics.
+
+=== top ===
+
+        +----------Local Count, excluding submodules.
+        |
+       12 wires
+       30 cells
+        8   SB_CARRY
+       22   SB_LUT4
+
+=== design hierarchy ===
+
+       30 cells
+
+3.52. Executing JSON backend.
+"""
+
+NEXTPNR_TIM = """\
+Info: Device utilisation:
+Info: \t         ICESTORM_LC:    52/ 5280     0%
+Info: \t        ICESTORM_RAM:     2/   30     6%
+Info: Placed 55 cells based on constraints.
+Info: Max frequency for clock 'clk': 50.00 MHz (PASS at 12.00 MHz)
+Info: Max frequency for clock 'clk': 97.50 MHz (PASS at 12.00 MHz)
+Warning: Max frequency for clock 'fast': 40.10 MHz (FAIL at 48.00 MHz)
+
+Info: Slack histogram:
+Info:  legend: * represents 2 endpoint(s)
+Info:          + represents [1,2) endpoint(s)
+Info: [ 72000,  73000) |**+
+Info: [ 73000,  74000) |*****
+Info: Program finished normally.
+"""
+
+
+def test_parses_yosys_stats(tmp_path):
+    for text, cells in [
+        (YOSYS_RPT, {"SB_CARRY": 8, "SB_DFF": 9, "SB_LUT4": 13}),
+        (YOSYS_RPT_NEW, {"SB_CARRY": 8, "SB_LUT4": 22}),
+    ]:
+        path = tmp_path / "top.rpt"
+        path.write_text(text)
+        assert BuildReport.from_logs(yosys=path).cells == {"top": cells}
+
+
+def test_parses_nextpnr_log(tmp_path):
+    path = tmp_path / "top.tim"
+    path.write_text(NEXTPNR_TIM)
+    report = BuildReport.from_logs(nextpnr=path)
+
+    assert report.utilisation == {
+        "ICESTORM_LC": Utilisation(used=52, available=5280),
+        "ICESTORM_RAM": Utilisation(used=2, available=30),
+    }
+    assert report.fmax == {
+        "clk": ClockTiming(achieved_mhz=97.5, target_mhz=12.0, passed=True),
+        "fast": ClockTiming(achieved_mhz=40.1, target_mhz=48.0, passed=False),
+    }
+    assert report.slack_histogram == [
+        SlackBin(lower=72000, upper=73000, endpoints=5),
+        SlackBin(lower=73000, upper=74000, endpoints=10),
+    ]
+
+
+def test_round_trips_json(tmp_path):
+    tim_path = tmp_path / "top.tim"
+    tim_path.write_text(NEXTPNR_TIM)
+    report = BuildReport.from_logs(nextpnr=tim_path)
+    report.save(tmp_path / "top.report.json")
+
+    assert BuildReport.load(tmp_path / "top.report.json") == report
+
+
+def test_estimates_utilisation(tmp_path):
+    path = tmp_path / "top.rpt"
+    path.write_text(YOSYS_RPT)
+    assert BuildReport.from_logs(yosys=path).estimated_utilisation() == {"ICESTORM_LC": 13}
+
+    assert estimate_utilisation({
+        "SB_LUT4": 4, "SB_DFFE": 3, "SB_DFFSR": 2, "SB_RAM40_4K": 1, "SB_IO": 5,
+    }) == {"ICESTORM_LC": 5, "ICESTORM_RAM": 1, "SB_IO": 5}
+    assert estimate_utilisation({
+        "LUT4": 10, "CCU2C": 3, "TRELLIS_FF": 7, "DP16KD": 2,
+    }) == {"TRELLIS_COMB": 16, "TRELLIS_FF": 7, "DP16KD": 2}
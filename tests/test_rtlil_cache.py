@@ -0,0 +1,169 @@
+import re
+import sys
+
+import pytest
+from amaranth import Module, Signal
+from amaranth.back import rtlil
+from amaranth.lib import data, wiring
+from amaranth.lib.wiring import In, Out
+
+from niar import cache_rtlil
+from niar.rtlil_cache import RtlilCache
+
+
+elaborations = []
+
+
+@cache_rtlil
+class Counter(wiring.Component):
+    en: In(1)
+    count: Out(8)
+
+    def __init__(self, step):
+        self.step = step
+        super().__init__()
+
+    def elaborate(self, platform):
+        elaborations.append(self.step)
+        m = Module()
+        with m.If(self.en):
+            m.d.sync += self.count.eq(self.count + self.step)
+        return m
+
+
+class Top(wiring.Component):
+    out: Out(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.a = a = Counter(1)
+        m.submodules.b = b = Counter(2)
+        m.d.comb += [a.en.eq(1), b.en.eq(1), self.out.eq(a.count + b.count)]
+        return m
+
+
+def test_converts_marked_components_separately(tmp_path):
+    elaborations.clear()
+    with RtlilCache(tmp_path) as cache:
+        top = rtlil.convert(Top(), name="top")
+
+    assert elaborations == [1, 2]
+    assert len(cache.modules) == 2
+    for name, module in cache.modules.items():
+        assert f"cell \\{name} " in top
+        assert f"module \\{name}\n" in module
+        assert "attribute \\top" not in module
+        assert "input" in module and "\\clk" in module
+
+    with RtlilCache(tmp_path) as cache_again:
+        assert rtlil.convert(Top(), name="top") == top
+    assert elaborations == [1, 2]
+    assert cache_again.modules == cache.modules
+
+
+def test_elaborates_as_usual_when_inactive():
+    elaborations.clear()
+    rtlil.convert(Top(), name="top")
+    assert elaborations == [1, 2]
+
+
+@cache_rtlil
+class Opaque(wiring.Component):
+    out: Out(8)
+
+    def __init__(self, config):
+        self.config = config
+        super().__init__()
+
+    def elaborate(self, platform):
+        return Module()
+
+
+class OpaqueTop(wiring.Component):
+    out: Out(8)
+
+    def __init__(self, config):
+        self.config = config
+        super().__init__()
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.opaque = opaque = Opaque(self.config)
+        m.d.comb += self.out.eq(opaque.out)
+        return m
+
+
+def test_rejects_arguments_without_a_stable_key(tmp_path):
+    with RtlilCache(tmp_path):
+        with pytest.raises(TypeError, match=r"Opaque can't have its RTLIL cached: argument #0"):
+            rtlil.convert(OpaqueTop(object()), name="top")
+
+
+def test_keys_on_arguments_not_their_repr(tmp_path):
+    with RtlilCache(tmp_path) as cache:
+        rtlil.convert(OpaqueTop((1, "a", data.StructLayout({"x": 4}))), name="top")
+        rtlil.convert(OpaqueTop((1, "a", data.StructLayout({"x": 5}))), name="top")
+        rtlil.convert(OpaqueTop((1, "a", data.StructLayout({"x": 5}))), name="top")
+    assert len(cache.modules) == 2
+
+
+def test_skips_monitoring_tool_ids_in_use(tmp_path):
+    taken = [tool for tool in range(3, 6) if sys.monitoring.get_tool(tool) is None]
+    for tool in taken:
+        sys.monitoring.use_tool_id(tool, "test")
+    try:
+        with RtlilCache(tmp_path) as cache:
+            top = rtlil.convert(Top(), name="top")
+    finally:
+        for tool in taken:
+            sys.monitoring.free_tool_id(tool)
+    # Converted separately all the same, but not cached.
+    assert len(cache.modules) == 2
+    assert all(f"cell \\{name} " in top for name in cache.modules)
+    assert not list(tmp_path.glob("*.json"))
+
+
+class Stage(wiring.Component):
+    a: In(8)
+    y: Out(8)
+    # Looks like a clock domain's port; it's only the submodule's.
+    fast_clk: In(1)
+
+    def elaborate(self, platform):
+        m = Module()
+        with m.If(self.fast_clk):
+            m.d.sync += self.y.eq(self.a)
+        return m
+
+
+@cache_rtlil
+class Pipeline(wiring.Component):
+    x: In(8)
+    z: Out(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.stage = stage = Stage()
+        m.d.comb += [stage.a.eq(self.x), stage.fast_clk.eq(1), self.z.eq(stage.y)]
+        return m
+
+
+class PipelineTop(wiring.Component):
+    out: Out(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.pipeline = pipeline = Pipeline()
+        m.d.comb += [pipeline.x.eq(1), self.out.eq(pipeline.z)]
+        return m
+
+
+def test_instance_has_only_the_components_ports(tmp_path):
+    with RtlilCache(tmp_path) as cache:
+        top = rtlil.convert(PipelineTop(), name="top")
+
+    [name] = cache.modules
+    assert f"module \\{name}.stage\n" in cache.modules[name]
+    cell = top[top.index(f"cell \\{name} "):]
+    cell = cell[:cell.index("\n  end\n")]
+    assert sorted(re.findall(r"connect \\(\S+) ", cell)) == ["clk", "rst", "x", "z"]